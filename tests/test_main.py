@@ -1,9 +1,26 @@
+import pytest
+
+@pytest.fixture(scope="session")
+def vpip_home(tmp_path_factory):
+    """A ``~/.vpip`` folder shared by all tests, so templates are only built
+    once."""
+    return tmp_path_factory.mktemp("vpip")
+
+@pytest.fixture(autouse=True)
+def isolate_vpip_home(vpip_home, monkeypatch):
+    """Don't write the store, templates, and locks to the real ``~/.vpip``."""
+    from vpip import lock, store, venv
+    monkeypatch.setattr(store, "STORE_FOLDER", str(vpip_home / "store"))
+    monkeypatch.setattr(venv, "TEMPLATE_FOLDER", str(vpip_home / "templates"))
+    monkeypatch.setattr(lock, "LOCK_FOLDER", str(vpip_home / "locks"))
+
 def test_pypi_compatible():
     from vpip.pypi import is_compatible
     from packaging.version import parse as p
     assert is_compatible(p("0.1.0"), p("0.2.0")) is False
     assert is_compatible(p("1.1.0"), p("1.2.0")) is True
     assert is_compatible(p("1.1.0"), p("2.2.0")) is False
+    assert is_compatible(p("0.1.0"), p("1!0.1.1")) is False
     
 def test_global_script_folder():
     # make sure the script folder is already in the path
@@ -87,3 +104,740 @@ def test_vpip_config_toml():
     with create_files(files):
         config = dependency.get_vpip_config()
         assert config == {"command_fallback": "foo", "commands": {"test": "bar"}}
+
+def test_inspect_site_packages():
+    from yamldirs import create_files
+    from vpip.commands.install import install_local_first_time
+    from vpip import pip_api, venv
+    files = """
+    requirements.txt: |
+        twine~=3.0
+    """
+    def get_versions(installed):
+        return {d["metadata"]["name"]: d["metadata"]["version"] for d in installed}
+    with create_files(files):
+        install_local_first_time()
+        vv = venv.get_current_venv()
+        with vv.activate():
+            installed = pip_api.inspect_site_packages(venv.get_site_packages(vv.env_dir))
+            assert get_versions(installed) == get_versions(pip_api.inspect_pip())
+
+def create_fake_venv(path):
+    import venv as venv_
+    from vpip import venv
+    venv_.EnvBuilder().create(path)
+    return venv.Venv(path)
+
+def add_fake_dist(vv, name, version, requires=()):
+    import os
+    from vpip import venv
+    [site_packages] = venv.get_site_packages(vv.env_dir)
+    dist_info = os.path.join(site_packages, f"{name}-{version}.dist-info")
+    os.mkdir(dist_info)
+    with open(os.path.join(dist_info, "METADATA"), "w", encoding="utf8") as f:
+        f.write(f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n")
+        for spec in requires:
+            f.write(f"Requires-Dist: {spec}\n")
+    return dist_info
+
+def test_venv_config_percent(tmp_path):
+    from vpip import venv
+    env_dir = tmp_path / "100%"
+    env_dir.mkdir()
+    (env_dir / "pyvenv.cfg").write_text("home = /opt/100%python/bin\nversion = 3.12.0\n", encoding="utf8")
+    assert venv.get_venv_config(env_dir)["home"] == "/opt/100%python/bin"
+
+def test_inspect_cache(tmp_path):
+    import os
+    from vpip import pip_api
+    vv = create_fake_venv(tmp_path / ".venv")
+    add_fake_dist(vv, "foo", "1.0")
+    with vv.activate():
+        assert pip_api.get_pkg_info("foo").version == "1.0"
+        assert os.path.exists(os.path.join(vv.env_dir, pip_api.INSPECT_CACHE_FILE))
+        pip_api.inspect_result.clear()
+        assert pip_api.get_pkg_info("foo").version == "1.0"
+        add_fake_dist(vv, "bar", "2.0")
+        pip_api.inspect_result.clear()
+        assert pip_api.get_pkg_info("bar").version == "2.0"
+
+def test_refresh_inspect(tmp_path):
+    import shutil
+    from vpip import pip_api
+    vv = create_fake_venv(tmp_path / ".venv")
+    foo = add_fake_dist(vv, "foo", "1.0", ["bar>=1"])
+    with vv.activate():
+        graph = pip_api.inspect()
+        assert not graph.packages["foo"].requires
+        add_fake_dist(vv, "bar", "1.0")
+        pip_api.refresh_inspect()
+        assert graph.packages["foo"].requires == {graph.packages["bar"]}
+        shutil.rmtree(foo)
+        add_fake_dist(vv, "foo", "2.0", ["bar"])
+        pip_api.refresh_inspect()
+        assert graph.packages["foo"].version == "2.0"
+        assert graph.packages["bar"].required_by == {graph.packages["foo"]}
+        pip_api.inspect_result.clear()
+        assert pip_api.get_pkg_info("foo").version == "2.0"
+
+def test_list_from_graph(tmp_path):
+    import json
+    import os
+    from vpip import pip_api
+    vv = create_fake_venv(tmp_path / ".venv")
+    add_fake_dist(vv, "foo", "1.0", ["bar"])
+    add_fake_dist(vv, "Bar", "2.0")
+    dist_info = add_fake_dist(vv, "my-pkg", "0.1.0", ["foo"])
+    with open(os.path.join(dist_info, "direct_url.json"), "w", encoding="utf8") as f:
+        json.dump({"url": "file:///my-pkg", "dir_info": {"editable": True}}, f)
+    with vv.activate():
+        assert [(p.name, p.version) for p in pip_api.list_()] == [("Bar", "2.0"), ("foo", "1.0")]
+        assert [p.name for p in pip_api.list_(not_required=True)] == []
+        assert pip_api.freeze(exclude=["foo"]) == ["Bar==2.0"]
+
+def test_uninstall_dry_run(tmp_path, monkeypatch, capsys):
+    from vpip.commands.uninstall import uninstall_local
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pyproject.toml").write_text("[project]\nname = 'my-pkg'\ndependencies = ['foo']\n")
+    (tmp_path / "requirements.txt").write_text("qux==1.0\n")
+    vv = create_fake_venv(tmp_path / ".venv")
+    add_fake_dist(vv, "foo", "1.0", ["bar"])
+    add_fake_dist(vv, "bar", "1.0", ["baz"])
+    add_fake_dist(vv, "baz", "1.0", ["bar"])
+    add_fake_dist(vv, "qux", "1.0", ["bar"])
+    add_fake_dist(vv, "orphan", "1.0")
+    uninstall_local(["foo"], dry_run=True)
+    assert capsys.readouterr().out == "Would remove:\n  foo\n  orphan\n"
+    uninstall_local(["foo", "qux"], dry_run=True)
+    assert capsys.readouterr().out == "Would remove:\n  bar\n  baz\n  foo\n  orphan\n  qux\n"
+
+def test_why(tmp_path, monkeypatch, capsys):
+    from vpip import pip_api
+    from vpip.commands.why import print_why
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "requirements.txt").write_text("foo==1.0\nqux==1.0\n")
+    vv = create_fake_venv(tmp_path / ".venv")
+    add_fake_dist(vv, "foo", "1.0", ["bar"])
+    add_fake_dist(vv, "bar", "1.0", ["baz"])
+    add_fake_dist(vv, "baz", "1.0", ["bar"])
+    add_fake_dist(vv, "qux", "1.0", ["baz"])
+    with vv.activate():
+        graph = pip_api.inspect()
+        foo, bar, baz = (graph.packages[n] for n in ["foo", "bar", "baz"])
+        assert graph.get_dependencies(foo) == {bar, baz}
+        assert graph.get_dependents(baz) == {foo, bar, graph.packages["qux"]}
+        assert graph.find_path(foo, baz) == [foo, bar, baz]
+        print_why("baz")
+    assert capsys.readouterr().out == (
+        "baz 1.0\n"
+        "Required by:\n"
+        "  bar 1.0\n"
+        "  qux 1.0\n"
+        "Dependency paths:\n"
+        "  foo -> bar -> baz\n"
+        "  qux -> baz\n"
+    )
+
+def test_iter_inspect_installed():
+    import json
+    from vpip import pip_api
+    installed = [
+        {
+            "metadata": {"name": "foo", "version": "1.0", "requires_dist": ["bar"], "summary": "{not closed"},
+            "metadata_location": "/foo-1.0.dist-info",
+            "installer": "pip"
+        },
+        {
+            "metadata": {"name": "bar", "version": "2.0"},
+            "metadata_location": "/bar-2.0.dist-info",
+            "direct_url": {"url": "file:///bar", "dir_info": {"editable": True}}
+        }
+    ]
+    output = json.dumps({"version": "1", "pip_version": "24.0", "installed": installed, "environment": {}}, indent=2)
+    lines = output.splitlines(True)
+    result = list(pip_api.iter_inspect_installed(lines))
+    assert [d["metadata"]["name"] for d in result] == ["foo", "bar"]
+    assert "installer" not in result[0] and "summary" not in result[0]["metadata"]
+    assert result[1]["metadata"]["requires_dist"] == []
+    assert result[1]["direct_url"]["dir_info"]["editable"]
+    assert list(pip_api.iter_inspect_installed([json.dumps({"version": "1", "installed": []})])) == []
+
+def test_pip_events():
+    from vpip import pip_events
+    classifier = pip_events.OutputClassifier()
+    lines = [
+        "Collecting requests~=2.0 (from -r requirements.txt (line 1))",
+        "  Downloading requests-2.32.3-py3-none-any.whl.metadata (4.6 kB)",
+        "Collecting foo",
+        "  Using cached foo-1.0.tar.gz (1.5 MB)",
+        "Building wheel for foo (pyproject.toml) ... done",
+        "Installing collected packages: foo, requests",
+        "Successfully installed foo-1.0 requests-2.32.3",
+    ]
+    events = [e for line in lines for e in classifier.feed(line, 1.0)]
+    assert events == [
+        pip_events.Collecting("requests", "requests~=2.0", 1.0),
+        pip_events.Downloading("requests", "requests-2.32.3-py3-none-any.whl.metadata", 4600, 1.0),
+        pip_events.Collecting("foo", "foo", 1.0),
+        pip_events.CacheHit("foo", "foo-1.0.tar.gz", 1500000, 1.0),
+        pip_events.BuildingWheel("foo", 1.0),
+        pip_events.Installed("foo", "1.0", 1.0),
+        pip_events.Installed("requests", "2.32.3", 1.0),
+    ]
+
+def test_pip_worker():
+    import subprocess
+    import sys
+    import pytest
+    from vpip.execute import PipWorker
+    worker = PipWorker(sys.executable)
+    try:
+        assert "".join(worker.execute(["--version"])).startswith("pip ")
+        with pytest.raises(subprocess.CalledProcessError):
+            list(worker.execute(["show", "not-a-real-package-vpip"]))
+        assert worker.alive()
+        assert "".join(worker.execute(["--version"])).startswith("pip ")
+        # an abandoned output doesn't block the next command
+        output = worker.execute(["show", "pip"])
+        next(output)
+        del output
+        assert "".join(worker.execute(["--version"])).startswith("pip ")
+    finally:
+        worker.close()
+
+def test_may_prompt(monkeypatch):
+    import io
+    import sys
+    from vpip import pip_api
+    class TTY(io.StringIO):
+        def isatty(self):
+            return True
+    monkeypatch.setattr(sys, "stdin", io.StringIO())
+    assert not pip_api.may_prompt(["install", "foo"])
+    monkeypatch.setattr(sys, "stdin", TTY())
+    assert pip_api.may_prompt(["install", "foo"])
+    assert pip_api.may_prompt(["uninstall", "foo"])
+    assert not pip_api.may_prompt(["uninstall", "-y", "foo"])
+    assert not pip_api.may_prompt(["inspect", "--local"])
+
+def test_check_updates_order(monkeypatch):
+    import time
+    from vpip import pypi
+    def check_update(pkg, curr_version):
+        time.sleep(0.1 if pkg == "a" else 0)
+        return pypi.UpdateResult(pkg, None)
+    monkeypatch.setattr(pypi, "check_update", check_update)
+    results = list(pypi.check_updates([("a", "1.0"), ("b", "1.0"), ("c", None), ("d", "1.0")], concurrency=4))
+    assert [r and r.compatible for r in results] == ["a", "b", None, "d"]
+
+def serve_http(routes):
+    """Serve ``path -> (headers, body)`` routes on localhost. Return the
+    server and a list of request headers."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    requests = []
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append((self.path, dict(self.headers)))
+            if self.path not in routes:
+                self.send_response(404)
+                self.end_headers()
+                return
+            headers, body = routes[self.path]
+            if headers.get("ETag") and self.headers.get("If-None-Match") == headers["ETag"]:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args):
+            pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requests
+
+def test_fetch_cache(tmp_path, monkeypatch):
+    import json
+    from vpip import pypi
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pypi, "CACHE_FOLDER", str(tmp_path / "cache"))
+    body = json.dumps({"releases": {"1.0": [], "1.1": []}}).encode()
+    server, requests = serve_http({"/pypi/foo/json": ({"ETag": '"v1"'}, body)})
+    url = "http://127.0.0.1:{}/pypi/foo/json".format(server.server_port)
+    parse = lambda r: list(r.json()["releases"])
+    try:
+        assert pypi.fetch(url, parse) == ["1.0", "1.1"]
+        assert pypi.fetch(url, parse) == ["1.0", "1.1"]
+        assert requests[1][1]["If-None-Match"] == '"v1"'
+        (tmp_path / "pyproject.toml").write_text("[tool.vpip]\ncache_ttl = 60\n")
+        assert pypi.fetch(url, parse) == ["1.0", "1.1"]
+        assert len(requests) == 2
+    finally:
+        server.shutdown()
+
+def test_get_versions(tmp_path, monkeypatch):
+    import json
+    from vpip import pypi
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pypi, "CACHE_FOLDER", str(tmp_path / "cache"))
+    files = [{"filename": "foo-{}.tar.gz".format(i), "url": "x"} for i in range(5000)]
+    simple = json.dumps({"files": files, "name": "foo", "versions": ["1.0", "2.0"]}).encode()
+    releases = json.dumps({"releases": {"0.1": []}}).encode()
+    server, requests = serve_http({
+        "/simple/foo/": ({"Content-Type": pypi.SIMPLE_JSON_TYPE}, simple),
+        "/simple/bar/": ({"Content-Type": "text/html"}, b"<html></html>"),
+        "/pypi/bar/json": ({}, releases)
+    })
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.vpip]\nindex_url = "http://127.0.0.1:{}/simple/"\n'.format(server.server_port))
+    try:
+        assert pypi.get_versions("foo") == ["1.0", "2.0"]
+        assert requests[0][1]["Accept"] == pypi.SIMPLE_JSON_TYPE
+        assert pypi.get_versions("bar") == ["0.1"]
+        assert [path for path, _headers in requests] == ["/simple/foo/", "/simple/bar/", "/pypi/bar/json"]
+    finally:
+        server.shutdown()
+    chunks = ['{"versions": [', '"1.0", "2', '.0"], "ver', 'sions": []}']
+    assert pypi.find_json_value(iter(chunks[1:3]), "versions") is None
+    assert pypi.find_json_value(iter(['{"a": 1, "vers', 'ions"', ': ["1.0"]}']), "versions") == ["1.0"]
+    assert pypi.find_json_value(iter(chunks), "versions") == ["1.0", "2.0"]
+
+def test_offline(tmp_path, monkeypatch):
+    import json
+    import os
+    import pytest
+    from vpip import pypi
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pypi, "CACHE_FOLDER", str(tmp_path / "cache"))
+    monkeypatch.delenv("PIP_NO_INDEX", raising=False)
+    body = json.dumps({"versions": ["1.0", "1.1"]}).encode()
+    server, requests = serve_http({"/simple/foo/": ({"Content-Type": pypi.SIMPLE_JSON_TYPE}, body)})
+    monkeypatch.setenv("PIP_INDEX_URL", "http://127.0.0.1:{}/simple".format(server.server_port))
+    try:
+        assert pypi.get_versions("foo") == ["1.0", "1.1"]
+    finally:
+        server.shutdown()
+        server.server_close()
+    (tmp_path / "pyproject.toml").write_text('[tool.vpip]\nwheelhouse = "wheels"\n')
+    with pypi.use_index(offline=True):
+        assert os.environ["PIP_NO_INDEX"] == "1"
+        assert os.environ["PIP_FIND_LINKS"] == str(tmp_path / "wheels")
+        assert pypi.get_versions("foo") == ["1.0", "1.1"]
+        assert pypi.check_update("foo", "1.0").compatible == pypi.Version("1.1")
+        with pytest.raises(Exception, match="not cached"):
+            pypi.get_versions("bar")
+    assert len(requests) == 1
+    assert "PIP_NO_INDEX" not in os.environ
+    assert not pypi.is_offline()
+
+def test_version_index():
+    from vpip.pypi import Version, VersionIndex
+    data = VersionIndex.build(["0.1.0", "1.2.0", "0.1.3", "1.10.0", "2.0.0b1", "1.9", "0.2.0", "bad", "3.0"])
+    assert data == [
+        [0, 0, 1, ["0.1.0", "0.1.3"]],
+        [0, 0, 2, ["0.2.0"]],
+        [0, 1, 2, ["1.2.0"]],
+        [0, 1, 9, ["1.9"]],
+        [0, 1, 10, ["1.10.0"]],
+        [0, 3, 0, ["3.0"]]
+    ]
+    index = VersionIndex(data)
+    assert index.latest() == Version("3.0")
+    assert index.latest_compatible(Version("0.1.1")) == Version("0.1.3")
+    assert index.latest_compatible(Version("1.0")) == Version("1.10.0")
+    assert index.latest_compatible(Version("2.0")) is None
+    assert index.latest_compatible(Version("0.3")) is None
+    # epochs
+    index = VersionIndex(VersionIndex.build(["0.1", "0.2", "1!0.1.0", "1!0.1.1", "1!1.0", "5.0"]))
+    assert index.latest() == Version("1!1.0")
+    assert index.latest_compatible(Version("0.1.0")) == Version("0.1")
+    assert index.latest_compatible(Version("1!0.1.0")) == Version("1!0.1.1")
+    assert index.latest_compatible(Version("1!1.0")) == Version("1!1.0")
+    assert index.latest_compatible(Version("1!5.0")) is None
+    assert VersionIndex(VersionIndex.build([])).latest() is None
+
+def test_clone_venv(tmp_path, monkeypatch):
+    import os
+    from pathlib import Path
+    import subprocess
+    from vpip import venv
+    monkeypatch.setattr(venv, "TEMPLATE_FOLDER", str(tmp_path / "templates"))
+    vv = venv.Venv(str(tmp_path / "foo"))
+    vv.create()
+    template_dir = venv.get_template_folder()
+    origin = (Path(template_dir) / venv.TEMPLATE_ORIGIN_FILE).read_text()
+    assert not (tmp_path / "foo" / venv.TEMPLATE_ORIGIN_FILE).exists()
+    activate = (tmp_path / "foo/bin/activate").read_text()
+    assert origin not in activate
+    assert str(tmp_path / "foo") in activate
+    assert "(foo) " in activate
+    output = subprocess.run(
+        [str(tmp_path / "foo/bin/pip"), "--version"], check=True, capture_output=True, text=True
+    ).stdout
+    assert str(tmp_path / "foo") in output
+    # only compiled files are shared with the template
+    site_packages = venv.get_site_packages(str(tmp_path / "foo"))[0]
+    template_site_packages = venv.get_site_packages(template_dir)[0]
+    assert not os.path.samefile(Path(site_packages, "pip/__init__.py"), Path(template_site_packages, "pip/__init__.py"))
+    [pyc] = [p.name for p in Path(template_site_packages, "pip/__pycache__").glob("__init__.*.pyc")]
+    assert os.path.samefile(Path(site_packages, "pip/__pycache__", pyc), Path(template_site_packages, "pip/__pycache__", pyc))
+    # the template is only built if missing
+    venv.update_template()
+    assert (Path(template_dir) / venv.TEMPLATE_ORIGIN_FILE).read_text() == origin
+    venv.update_template(force=True)
+    assert (Path(template_dir) / venv.TEMPLATE_ORIGIN_FILE).read_text() != origin
+    assert sorted(os.listdir(tmp_path / "templates")) == [os.path.basename(template_dir)]
+
+def test_store(tmp_path, monkeypatch):
+    import json
+    import os
+    from vpip import pip_api, store, venv
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(store, "STORE_FOLDER", str(tmp_path / "store"))
+    assert not store.is_enabled()
+    (tmp_path / "pyproject.toml").write_text("[tool.vpip]\nstore = true\n")
+    venvs = [create_fake_venv(tmp_path / name) for name in ["a", "b"]]
+    files = []
+    for vv in venvs:
+        dist_info = add_fake_dist(vv, "foo", "1.0")
+        files.append(os.path.join(os.path.dirname(dist_info), "foo.py"))
+        with open(files[-1], "w", encoding="utf8") as f:
+            f.write("x = 1\n")
+        with open(os.path.join(dist_info, "WHEEL"), "w", encoding="utf8") as f:
+            f.write("Wheel-Version: 1.0\nTag: py3-none-any\n")
+        with open(os.path.join(dist_info, "RECORD"), "w", encoding="utf8") as f:
+            f.write("foo.py,sha256=abc,6\n")
+            f.write("foo-1.0.dist-info/METADATA,sha256=def,50\n")
+            f.write("foo-1.0.dist-info/RECORD,,\n")
+            f.write("../../../bin/foo,sha256=ghi,10\n")
+        with vv.activate():
+            store.link_packages()
+    entry = store.get_entry_folder("foo", "1.0", "py3-none-any")
+    assert os.path.samefile(files[0], files[1])
+    # the inspect cache is refreshed after linking
+    site_packages = venv.get_site_packages(venvs[1].env_dir)
+    with open(os.path.join(venvs[1].env_dir, pip_api.INSPECT_CACHE_FILE), encoding="utf8") as f:
+        fingerprint = json.load(f)["fingerprint"]
+    assert fingerprint == pip_api.get_fingerprint(site_packages, pip_api.iter_metadata_folders(site_packages))
+    assert os.path.samefile(files[0], os.path.join(entry, "files", "foo.py"))
+    assert sorted(os.listdir(os.path.join(entry, "files"))) == ["foo-1.0.dist-info", "foo.py"]
+    assert store.prune() == []
+    for vv in venvs:
+        vv.destroy()
+    assert store.prune() == [entry]
+    assert os.listdir(tmp_path / "store") == []
+
+def test_execute_jobs(capsys):
+    import pytest
+    from vpip.execute import execute_jobs
+    with pytest.raises(Exception, match="some jobs failed: bad"):
+        execute_jobs({"good": ["why", "-h"], "bad": ["why"]}, 2)
+    lines = capsys.readouterr().out.splitlines()
+    assert "[good] usage: vpip why [-h] PACKAGE" in lines
+    assert all(line.startswith(("[good] ", "[bad] ")) for line in lines[:-2])
+    assert lines[-2:] == ["1 succeeded, 1 failed", "  bad"]
+
+def test_linker(tmp_path):
+    from vpip.commands.link import Linker
+    src = tmp_path / "src"
+    src.write_text("foo")
+    dest = tmp_path / "dest"
+    dest.write_text("old")
+    Linker(src).make(dest)
+    assert dest.samefile(src)
+    Linker(src).make(dest)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dest", "src"]
+
+def test_venv_env(tmp_path):
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from vpip import pip_api
+    from vpip.execute import execute
+    venvs = [create_fake_venv(tmp_path / name) for name in ["a", "b"]]
+    for vv, version in zip(venvs, ["1.0", "2.0"]):
+        add_fake_dist(vv, "foo", version)
+    environ = dict(os.environ)
+    def check(vv):
+        [prefix] = execute(["python", "-c", "import sys; print(sys.prefix)"], capture=True, env=vv.env())
+        return prefix.strip(), pip_api.get_pkg_info("foo", venv=vv.env_dir).version
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(check, venvs * 4))
+    assert results == [(venvs[0].env_dir, "1.0"), (venvs[1].env_dir, "2.0")] * 4
+    assert dict(os.environ) == environ
+
+def test_artifacts(tmp_path, monkeypatch):
+    import io
+    import tarfile
+    import zipfile
+    from vpip import artifacts, pypi
+    monkeypatch.setattr(artifacts, "ARTIFACT_FOLDER", str(tmp_path / "artifacts"))
+    sdist = io.BytesIO()
+    with tarfile.open(fileobj=sdist, mode="w:gz") as t:
+        data = b"Metadata-Version: 2.1\nName: Foo-Bar\nVersion: 1.0\n"
+        info = tarfile.TarInfo("foo_bar-1.0/PKG-INFO")
+        info.size = len(data)
+        t.addfile(info, io.BytesIO(data))
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("baz-master/pyproject.toml", '[project]\nname = "baz"\n')
+        z.writestr("baz-master/src/pyproject.toml", '[project]\nname = "wrong"\n')
+    server, requests = serve_http({
+        "/foo_bar-1.0.tar.gz": ({"ETag": '"v1"'}, sdist.getvalue()),
+        "/archive/master.zip": ({}, archive.getvalue())
+    })
+    base = "http://127.0.0.1:{}".format(server.server_port)
+    try:
+        file = artifacts.download(base + "/foo_bar-1.0.tar.gz#sha256=abc")
+        assert file.endswith("foo_bar-1.0.tar.gz")
+        assert artifacts.get_name(file) == "Foo-Bar"
+        assert artifacts.download(base + "/foo_bar-1.0.tar.gz") == file
+        assert requests[1][1]["If-None-Match"] == '"v1"'
+        assert artifacts.get_name(artifacts.download(base + "/archive/master.zip")) == "baz"
+    finally:
+        server.shutdown()
+        server.server_close()
+    with pypi.use_index(offline=True):
+        assert artifacts.download(base + "/foo_bar-1.0.tar.gz") == file
+    assert artifacts.get_name_from_archive("foo_bar-1.0-py3-none-any.whl") == "foo-bar"
+
+def test_registry(tmp_path, monkeypatch, capsys):
+    import shutil
+    from vpip import registry, venv
+    from vpip.commands import list as list_
+    monkeypatch.setattr(venv, "GLOBAL_FOLDER", str(tmp_path / "pkg_venvs"))
+    monkeypatch.setattr(registry, "REGISTRY_FILE", str(tmp_path / "registry.json"))
+    for name in ["foo", "bar"]:
+        vv = create_fake_venv(venv.get_global_folder(name))
+        add_fake_dist(vv, name, "1.0")
+    registry.update("foo", ["foo-cli"])
+    entries = registry.get_entries()
+    assert list(entries) == ["bar", "foo"]
+    assert entries["foo"]["scripts"] == ["foo-cli"]
+    assert entries["foo"]["freeze"] == ["foo==1.0"]
+    assert entries["bar"]["version"] == "1.0"
+    # entries are not rescanned if they are fresh
+    scan = registry.scan
+    monkeypatch.setattr(registry, "scan", None)
+    list_.print_global_packages()
+    assert capsys.readouterr().out == "bar 1.0\nfoo 1.0\n"
+    monkeypatch.setattr(registry, "scan", scan)
+    shutil.rmtree(venv.get_global_folder("bar"))
+    add_fake_dist(venv.Venv(venv.get_global_folder("foo")), "baz", "2.0")
+    entries = registry.get_entries()
+    assert list(entries) == ["foo"]
+    assert entries["foo"]["freeze"] == ["baz==2.0", "foo==1.0"]
+    assert entries["foo"]["scripts"] == ["foo-cli"]
+    assert list(registry.load()) == ["foo"]
+    # broken venvs are kept so update_venv can rebuild them
+    broken = tmp_path / "pkg_venvs" / "broken"
+    broken.mkdir()
+    (broken / "pyvenv.cfg").write_text("home = /old/python\n")
+    entries = registry.get_entries()
+    assert list(entries) == ["broken", "foo"]
+    assert entries["broken"]["home"] == "/old/python"
+    assert entries["broken"]["version"] is None
+
+def test_lock(tmp_path, monkeypatch, capsys):
+    import subprocess
+    import sys
+    import threading
+    import time
+    import pytest
+    from vpip import lock
+    monkeypatch.setattr(lock, "LOCK_FOLDER", str(tmp_path / "locks"))
+    resource = str(tmp_path / "venv")
+    with lock.lock(resource):
+        with lock.lock(resource, exclusive=False):
+            assert lock.held_locks[resource].count == 2
+        assert lock.held_locks[resource].exclusive
+    with lock.lock(resource, exclusive=False):
+        with pytest.raises(RuntimeError):
+            with lock.lock(resource):
+                pass
+        assert not lock.held_locks[resource].exclusive
+        assert lock.held_locks[resource].count == 1
+    assert resource not in lock.held_locks
+    # hold the lock in another process
+    lock_file = lock.get_lock_file(resource)
+    code = "import fcntl, sys, time; f = open(sys.argv[1]); fcntl.flock(f, fcntl.{}); print('ok', flush=True); time.sleep(30)"
+    with subprocess.Popen([sys.executable, "-c", code.format("LOCK_SH"), lock_file], stdout=subprocess.PIPE) as p:
+        try:
+            p.stdout.readline()
+            with lock.lock(resource, exclusive=False, timeout=0.3):
+                pass
+            with pytest.raises(TimeoutError):
+                with lock.lock(resource, timeout=0.3):
+                    pass
+        finally:
+            p.kill()
+    assert "waiting for exclusive lock" in capsys.readouterr().err
+    assert not lock.held_locks
+    # threads exclude each other
+    acquired = threading.Event()
+    release = threading.Event()
+    def hold():
+        with lock.lock(resource, exclusive=False):
+            acquired.set()
+            release.wait(5)
+    def wait():
+        with lock.lock(resource, timeout=5):
+            pass
+    threads = [threading.Thread(target=hold), threading.Thread(target=wait)]
+    threads[0].start()
+    acquired.wait(5)
+    with pytest.raises(TimeoutError):
+        with lock.lock(resource, exclusive=False, timeout=0.3):
+            pass
+    threads[1].start()
+    # a waiting thread doesn't block locks of other resources
+    start = time.monotonic()
+    with lock.lock(str(tmp_path / "other")):
+        pass
+    assert time.monotonic() - start < 1
+    release.set()
+    for t in threads:
+        t.join()
+    assert not lock.held_locks
+
+def test_lock_hashes(tmp_path, monkeypatch, capsys):
+    import json
+    from vpip import dependency, pypi
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pypi, "CACHE_FOLDER", str(tmp_path / "cache"))
+    def release(*names):
+        return json.dumps({"urls": [
+            {"filename": name, "url": "https://files/" + name, "digests": {"sha256": name[:3]}}
+            for name in names
+        ]}).encode()
+    server, _requests = serve_http({
+        "/pypi/foo/1.0/json": ({}, release("foo-1.0.tar.gz", "foo-1.0-py3-none-any.whl")),
+        "/pypi/bar/2.0/json": ({}, release("bar-2.0.tar.gz"))
+    })
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.vpip]\nindex_url = "http://127.0.0.1:{}/simple"\n'.format(server.server_port))
+    try:
+        text = pypi.format_hashed_lock(["foo==1.0", "bar==2.0"])
+        assert pypi.format_hashed_lock(["foo==1.0", "baz==3.0"]) is None
+    finally:
+        server.shutdown()
+    assert text == "\n".join([
+        "# https://files/foo-1.0.tar.gz",
+        "# https://files/foo-1.0-py3-none-any.whl",
+        "foo==1.0 \\",
+        "    --hash=sha256:foo \\",
+        "    --hash=sha256:foo",
+        "# https://files/bar-2.0.tar.gz",
+        "bar==2.0 \\",
+        "    --hash=sha256:bar"
+    ])
+    assert "unable to get hashes of baz" in capsys.readouterr().out
+    assert not dependency.has_lock_hashes()
+    (tmp_path / dependency.LOCK_FILE).write_text(text)
+    assert dependency.has_lock_hashes()
+
+def test_sync_dry_run(tmp_path, monkeypatch, capsys):
+    from vpip import dependency
+    from vpip.commands import sync
+    monkeypatch.chdir(tmp_path)
+    vv = create_fake_venv(tmp_path / ".venv")
+    add_fake_dist(vv, "foo", "1.0")
+    add_fake_dist(vv, "bar", "1.0")
+    add_fake_dist(vv, "old_pkg", "0.1")
+    (tmp_path / dependency.LOCK_FILE).write_text("\n".join([
+        "# https://files/foo-1.0.tar.gz",
+        "foo==1.0 \\",
+        "    --hash=sha256:abc",
+        "Bar==2.0 \\",
+        "    --hash=sha256:def",
+        "baz==3.0 --hash=sha256:ghi"
+    ]))
+    assert [line for _req, line in dependency.read_lock()] == [
+        "foo==1.0 --hash=sha256:abc",
+        "Bar==2.0 --hash=sha256:def",
+        "baz==3.0 --hash=sha256:ghi"
+    ]
+    sync.sync(dry_run=True)
+    assert capsys.readouterr().out == "update bar 1.0 -> 2.0\ninstall baz==3.0\nuninstall old_pkg 0.1\n"
+    (tmp_path / dependency.LOCK_FILE).write_text("foo==1.0\nbar==1.0\nold-pkg==0.1\n")
+    sync.sync(dry_run=True)
+    assert capsys.readouterr().out == "already in sync\n"
+
+def test_stamp(tmp_path, monkeypatch, capsys):
+    import os
+    from vpip import dependency, venv
+    from vpip.commands import install
+    monkeypatch.chdir(tmp_path)
+    vv = create_fake_venv(tmp_path / ".venv")
+    (tmp_path / "requirements.txt").write_text("foo==1.0\n")
+    assert dependency.check_stamp(vv.env_dir) is None
+    dependency.write_stamp(vv.env_dir)
+    assert dependency.check_stamp(vv.env_dir)
+    install.install_local_first_time()
+    assert capsys.readouterr().out == "the venv is up to date\n"
+    (tmp_path / "requirements.txt").write_text("foo==2.0\n")
+    assert dependency.check_stamp(vv.env_dir) is False
+    (tmp_path / "requirements.txt").write_text("foo==1.0\n")
+    assert dependency.check_stamp(vv.env_dir)
+    (tmp_path / "pyproject.toml").write_text('[project]\ndependencies = ["bar~=1.0"]\n')
+    assert dependency.check_stamp(vv.env_dir) is False
+    (tmp_path / "pyproject.toml").unlink()
+    assert dependency.check_stamp(vv.env_dir)
+    # the base interpreter is upgraded in place
+    get_python_id = venv.get_python_id
+    with monkeypatch.context() as m:
+        m.setattr(venv, "get_python_id", lambda executable=None: get_python_id(executable) + "-new")
+        assert dependency.check_stamp(vv.env_dir) is False
+    [site_packages] = venv.get_site_packages(vv.env_dir)
+    os.utime(site_packages, (0, 0))
+    dependency.write_stamp(vv.env_dir)
+    add_fake_dist(vv, "bar", "1.0")
+    assert dependency.check_stamp(vv.env_dir) is False
+
+def test_cli_jobs(monkeypatch):
+    from vpip import execute, venv
+    from vpip.cli import cli
+    calls = []
+    monkeypatch.setattr(execute, "execute_jobs", lambda jobs, max_workers: calls.append((jobs, max_workers)))
+    monkeypatch.setattr(venv, "update_template", lambda: None)
+    cli(["update", "-g", "-j", "2", "foo", "bar"])
+    cli(["update_venv", "--no-template", "-j", "2", "-g", "foo"])
+    assert calls == [
+        ({"foo": ["update", "-g", "foo"], "bar": ["update", "-g", "bar"]}, 2),
+        ({"foo": ["update_venv", "--no-template", "-g", "foo"]}, 2)
+    ]
+
+def test_update_venv_stamp(tmp_path, monkeypatch):
+    import os
+    from vpip import dependency, pip_api, venv
+    from vpip.commands import update_venv
+    monkeypatch.chdir(tmp_path)
+    vv = create_fake_venv(tmp_path / ".venv")
+    [site_packages] = venv.get_site_packages(vv.env_dir)
+    os.utime(site_packages, (0, 0))
+    dependency.write_stamp(vv.env_dir)
+    monkeypatch.setattr(pip_api, "install", lambda *args, **kwargs: add_fake_dist(vv, "pip", "99.0"))
+    update_venv.update_venv(vv)
+    assert dependency.check_stamp(vv.env_dir)
+
+def test_inspect_pip_local(tmp_path):
+    import venv as venv_
+    from vpip import pip_api
+    venv_.EnvBuilder(system_site_packages=True, with_pip=True).create(tmp_path / "env")
+    names = {d["metadata"]["name"] for d in pip_api.inspect_pip(str(tmp_path / "env"))}
+    assert "pip" in names
+    assert "pytest" not in names
+
+def test_get_install_specs(tmp_path, monkeypatch):
+    from vpip import pip_api
+    monkeypatch.chdir(tmp_path)
+    for name in ["black", "foo-1.0-py3-none-any.whl"]:
+        (tmp_path / name).write_text("")
+    file = str(tmp_path / "download")
+    (tmp_path / "download").write_text("")
+    assert pip_api.get_install_specs(["black", "foo-1.0-py3-none-any.whl", file], False, False) == [
+        "black", "\"foo-1.0-py3-none-any.whl\"", "\"{}\"".format(file)
+    ]
@@ -0,0 +1,183 @@
+"""Download and inspect package archives from URLs.
+
+This module is used to install global packages from URLs. The project name
+is read from the archive without creating a venv, and the downloaded file
+is cached so pip can install it directly.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import tarfile
+import tempfile
+import zipfile
+from email.parser import HeaderParser
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote, urlsplit
+
+import packaging.utils
+import tomlkit
+
+from .execute import execute
+from .pip_api import ARCHIVE_EXTENSIONS
+
+#: Folder of downloaded archives.
+ARTIFACT_FOLDER: str = os.path.normpath(os.path.expanduser("~/.vpip/cache/artifacts"))
+
+def get_filename(url: str, content_disposition: Optional[str] = None) -> str:
+    """Get the filename of a URL. If the filename in the URL doesn't have an
+    archive extension, use the ``Content-Disposition`` header."""
+    filename = unquote(urlsplit(url).path.rstrip("/").rpartition("/")[2])
+    if filename.endswith(ARCHIVE_EXTENSIONS):
+        return filename
+    if content_disposition:
+        match = re.search(r'filename="?([^";]+)"?', content_disposition)
+        if match:
+            return os.path.basename(match.group(1))
+    return filename or "download"
+
+def download(url: str) -> str:
+    """Download a URL into :data:`ARTIFACT_FOLDER` and return the file path.
+
+    If the URL is already downloaded, a conditional request is sent and the
+    cached file is returned if it is not modified. In offline mode (see
+    :func:`vpip.pypi.use_index`), the cached file is returned without any
+    request.
+
+    :arg url: The URL. The fragment (e.g. ``#sha256=...``) is ignored.
+    """
+    from .pypi import get_session, is_offline
+    url = url.partition("#")[0]
+    folder = os.path.join(ARTIFACT_FOLDER, hashlib.sha256(url.encode("utf8")).hexdigest()[:32])
+    meta_file = os.path.join(folder, "meta.json")
+    try:
+        meta = json.loads(Path(meta_file).read_text(encoding="utf8"))
+        file = os.path.join(folder, meta["filename"])
+        if not os.path.exists(file):
+            meta = None
+    except (OSError, ValueError, KeyError):
+        meta = None
+    if meta and is_offline():
+        return file
+    if not meta and is_offline():
+        raise Exception("{} is not cached. Run the command without --offline first".format(url))
+    headers = {}
+    if meta and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    print("downloading {}".format(url))
+    with get_session().get(url, headers=headers, stream=True) as r:
+        if r.status_code == 304 and meta:
+            return file
+        r.raise_for_status()
+        filename = get_filename(r.url, r.headers.get("Content-Disposition"))
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in r.iter_content(64 * 1024):
+                    f.write(chunk)
+            file = os.path.join(folder, filename)
+            os.replace(tmp_file, file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        meta = {
+            "url": url,
+            "filename": filename,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified")
+        }
+    from .pip_api import write_json
+    write_json(meta_file, meta)
+    return file
+
+def read_archive(file: str, names: list) -> dict:
+    """Read files in the top folder of an archive.
+
+    :arg file: Path to a zip or tar archive.
+    :arg names: File names e.g. ``["PKG-INFO", "pyproject.toml"]``.
+    :return: A ``name -> text`` map. Files that don't exist are excluded.
+    """
+    result = {}
+    if zipfile.is_zipfile(file):
+        with zipfile.ZipFile(file) as z:
+            for info in z.infolist():
+                parts = info.filename.strip("/").split("/")
+                name = parts[-1]
+                if len(parts) <= 2 and name in names and name not in result:
+                    result[name] = z.read(info).decode("utf8")
+        return result
+    with tarfile.open(file) as t:
+        for member in t:
+            parts = member.name.strip("/").split("/")
+            name = parts[-1]
+            if len(parts) <= 2 and name in names and name not in result and member.isfile():
+                result[name] = t.extractfile(member).read().decode("utf8")
+    return result
+
+def get_name_from_archive(file: str) -> Optional[str]:
+    """Get the project name from a wheel or source archive without running
+    any build. Return None if the name can't be determined statically e.g.
+    it is only defined in ``setup.py``.
+
+    The name is read from the wheel filename, ``PKG-INFO``, ``[project]`` in
+    ``pyproject.toml``, or ``[metadata]`` in ``setup.cfg``.
+    """
+    filename = os.path.basename(file)
+    if filename.endswith(".whl"):
+        return packaging.utils.parse_wheel_filename(filename)[0]
+    files = read_archive(file, ["PKG-INFO", "pyproject.toml", "setup.cfg"])
+    if "PKG-INFO" in files:
+        name = HeaderParser().parsestr(files["PKG-INFO"]).get("Name")
+        if name:
+            return name
+    if "pyproject.toml" in files:
+        name = tomlkit.parse(files["pyproject.toml"]).get("project", {}).get("name")
+        if name:
+            return str(name)
+    if "setup.cfg" in files:
+        from configparser import ConfigParser, Error
+        config = ConfigParser()
+        try:
+            config.read_string(files["setup.cfg"])
+            name = config.get("metadata", "name", fallback=None)
+        except Error:
+            name = None
+        if name and "attr:" not in name:
+            return name
+    return None
+
+def get_name_from_report(file: str, python: str = sys.executable) -> str:
+    """Get the project name with ``pip install --dry-run --report``, which
+    builds the metadata but doesn't install anything.
+
+    :arg file: Path to the archive.
+    :arg python: The Python executable used to run pip. Default to the
+        interpreter running vpip.
+    """
+    fd, report_file = tempfile.mkstemp(prefix="vpip-report-", suffix=".json")
+    os.close(fd)
+    try:
+        execute([
+            python, "-m", "pip", "install", "--dry-run", "--no-deps", "--ignore-installed",
+            "--quiet", "--report", report_file, file
+        ])
+        with open(report_file, encoding="utf8") as f:
+            report = json.load(f)
+    finally:
+        os.remove(report_file)
+    return report["install"][0]["metadata"]["name"]
+
+def get_name(file: str) -> str:
+    """Get the project name of an archive. See :func:`get_name_from_archive`
+    and :func:`get_name_from_report`."""
+    try:
+        name = get_name_from_archive(file)
+    except (OSError, ValueError, tarfile.TarError, zipfile.BadZipFile, UnicodeDecodeError):
+        name = None
+    return name or get_name_from_report(file)
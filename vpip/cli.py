@@ -4,6 +4,8 @@ import shlex
 
 from . import commands
 from .dependency import get_vpip_config
+from .execute import use_pip_workers
+from .pypi import use_index
 
 def cli(args=None):
     """CLI entry point.
@@ -48,10 +50,13 @@ def cli(args=None):
     ns, extra = parser.parse_known_args(args)
     
     module = modules[ns.COMMAND]
+    offline = getattr(ns, "offline", False)
     if getattr(module, "allow_unknown", False):
-        module.run(ns, extra)
+        with use_index(offline), use_pip_workers():
+            module.run(ns, extra)
     elif not extra:
-        module.run(ns)
+        with use_index(offline), use_pip_workers():
+            module.run(ns)
     else:
         parser.error('unreconized arguments: {}'.format(' '.join(extra)))
     
@@ -63,8 +68,9 @@ def add_arguments(parser, options):
     :arg list options: List of options. See the source code in `vpip.commands <https://github.com/eight04/vpip/blob/95c9e03acf8239b342759aab238b28591cd4f214/vpip/commands/install.py#L2>`_ for example.
     """
     for option in options:
-        type = option.pop("type", None)
-        if type == "exclusive_group":
+        option = dict(option)
+        if option.get("type") == "exclusive_group":
+            del option["type"]
             sub_options = option.pop("options", [])
             group = parser.add_mutually_exclusive_group(**option)
             add_arguments(group, sub_options)
@@ -24,6 +24,11 @@ options = [
         "name": "PACKAGE",
         "nargs": "*",
         "help": "Package name"
+    },
+    {
+        "name": ["--offline"],
+        "action": "store_true",
+        "help": "Install packages from the wheelhouse without network access"
     }
 ]
 
@@ -37,12 +42,25 @@ def run(ns):
     else:
         install_local_first_time()
 
-def install_editable():
-    """Install the current cwd as editable package."""
+def install_editable(deps=True):
+    """Install the current cwd as editable package.
+    
+    :arg bool deps: Whether to install dependencies.
+    """
     from ..dependency import get_prod_updater
-    from ..pip_api import execute_pip
+    from ..pip_api import execute_pip, refresh_inspect
     if get_prod_updater().available():
-        execute_pip("install -e .")
+        execute_pip("install -e ." if deps else "install --no-deps -e .")
+        refresh_inspect()
+    
+def update_lock():
+    """Update the lock file. If ``lock_hashes`` is enabled, hashes are added
+    to the lock file. See :func:`vpip.dependency.update_lock`."""
+    from .. import dependency, pypi
+    if dependency.is_config_enabled("lock_hashes"):
+        dependency.update_lock(pypi.format_hashed_lock)
+    else:
+        dependency.update_lock()
     
 def install_global(packages, upgrade=False, latest=False):
     """Install global packages.
@@ -53,7 +71,7 @@ def install_global(packages, upgrade=False, latest=False):
     :arg bool latest: Upgrade to the latest version. By default, only
         compatible versions are selected.
     """
-    from .. import venv, pip_api
+    from .. import venv, pip_api, store, registry
     for pkg in packages:
         if pkg.startswith("http"):
             install_global_url(pkg)
@@ -66,24 +84,26 @@ def install_global(packages, upgrade=False, latest=False):
             with vv.activate(True):
                 # TODO: make pip support install_scripts
                 # https://github.com/pypa/pip/issues/3934
-                pip_api.install([pkg], upgrade=upgrade, latest=latest)
-                link_console_script(spec_to_pkg(pkg))
+                collected = pip_api.install([pkg], upgrade=upgrade, latest=latest)
+                store.link_packages(collected)
+                scripts = link_console_script(spec_to_pkg(pkg))
         except Exception:
             vv.destroy()
             raise
+        registry.update(pkg, scripts)
 
 def get_pkg_from_url(url):
-    # FIXME: is there a faster way?
-    from .. import venv, pip_api
-    vv = venv.get_global_tmp_venv()
-    with vv.activate(auto_create=True):
-        [pkg] = pip_api.install([url], deps=False)
-    vv.destroy()
-    return pkg
+    """Get the package name of a URL. The archive is downloaded into the
+    artifact cache and the name is read from its metadata. See
+    :mod:`vpip.artifacts`.
+    """
+    from .. import artifacts
+    return artifacts.get_name(artifacts.download(url))
 
 def install_global_url(url):
-    from .. import venv, pip_api
-    pkg = get_pkg_from_url(url)
+    from .. import venv, pip_api, store, artifacts, registry
+    file = artifacts.download(url)
+    pkg = artifacts.get_name(file)
     vv = venv.get_global_pkg_venv(pkg)
     if vv.exists():
         result = input(f"{pkg} has already been installed. Overwrite? (y/n) ")
@@ -93,11 +113,12 @@ def install_global_url(url):
             return
     try:
         with vv.activate(auto_create=True):
-            pip_api.install([url])
-            link_console_script(pkg)
+            store.link_packages(pip_api.install([file]))
+            scripts = link_console_script(pkg)
     except Exception:
         vv.destroy()
         raise
+    registry.update(pkg, scripts)
 
 def install_local(packages, dev=False, **kwargs):
     """Install local packages and save to dependency.
@@ -110,7 +131,7 @@ def install_local(packages, dev=False, **kwargs):
     if not packages:
         return
         
-    from .. import venv, pip_api, dependency
+    from .. import venv, pip_api, dependency, store
     vv = venv.get_current_venv()
     installed = {}
     with vv.activate(True):
@@ -118,7 +139,8 @@ def install_local(packages, dev=False, **kwargs):
             include=set(r.name for r in dependency.get_all()),
             exclude=set(dependency.spec_to_pkg(p) for p in packages)
         )
-        pip_api.install([*packages, *pinned_deps], **kwargs)
+        collected = pip_api.install([*packages, *pinned_deps], **kwargs)
+        store.link_packages(collected)
         for info in pip_api.get_pkg_infos([dependency.spec_to_pkg(i) for i in packages]):
             installed[info.name] = info.version
         if dev:
@@ -129,22 +151,34 @@ def install_local(packages, dev=False, **kwargs):
                 # rebuild egg file to avoid incompatible errors
                 # https://github.com/eight04/vpip/issues/19
                 install_editable()
-        dependency.update_lock()
+        update_lock()
+        dependency.write_stamp(vv.env_dir)
 
 def install_local_first_time():
     """Create the venv and install all dependencies.
     
     If the lock file exists, execute ``pip install -r requirements-lock.txt``.
+    If the lock file has hashes, dependencies are not resolved (see
+    :func:`vpip.pip_api.install_requirements`).
     
     Otherwise ``pip install -e . && pip install -r requirements.txt``.
+    
+    If the venv is up to date (see :func:`vpip.dependency.check_stamp`),
+    nothing is installed.
     """
-    from .. import venv, pip_api, dependency
+    from .. import venv, pip_api, dependency, store
     vv = venv.get_current_venv()
+    if vv.exists() and dependency.check_stamp(vv.env_dir):
+        print("the venv is up to date")
+        return
     with vv.activate(True):
         if dependency.has_lock():
-            pip_api.install_requirements(dependency.LOCK_FILE)
-            install_editable()
+            hashes = dependency.has_lock_hashes()
+            pip_api.install_requirements(dependency.LOCK_FILE, require_hashes=hashes)
+            install_editable(deps=not hashes)
         else:
             install_editable()
             pip_api.install_requirements()
-            dependency.update_lock()
+            update_lock()
+        store.link_packages()
+        dependency.write_stamp(vv.env_dir)
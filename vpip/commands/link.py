@@ -10,7 +10,7 @@ options = [
 def run(ns):
     from .. import venv
     vv = venv.get_current_venv()
-    with vv.activate():
+    with vv.activate(lock="shared"):
         pkg = ns.PACKAGE or get_current_pkg()
         link_console_script(pkg)
         
@@ -23,6 +23,8 @@ def link_console_script(pkg):
     the global scripts folder.
     
     :arg str pkg: Package name.
+    :return: Filenames of linked scripts.
+    :rtype: list[str]
     """
     import shutil
     import os
@@ -34,8 +36,9 @@ def link_console_script(pkg):
     entry_points = pip_api.get_pkg_info(pkg).entry_points
     config = ConfigParser()
     config.read_string(entry_points)
+    linked = []
     if "console_scripts" not in config:
-        return
+        return linked
     for executable in config["console_scripts"]:
         src = shutil.which(executable)
         if not src:
@@ -63,14 +66,26 @@ def link_console_script(pkg):
                 continue
             ok = True
             break
-        if not ok:
+        if ok:
+            linked.append(filename)
+        else:
             print("cannot link console script")
             print(errors)
+    return linked
         
 class Linker:
+    """Link a script to ``dest``. The link is created with a temporary name
+    then renamed to ``dest``, so concurrent jobs linking the same script
+    don't fail and ``dest`` never disappears.
+    """
     def __init__(self, src):
         self.src = src
         
+    def get_tmp(self, dest):
+        import os
+        import threading
+        return dest.with_name("{}.vpip-{}-{}".format(dest.name, os.getpid(), threading.get_ident()))
+        
     def unlink(self, dest):
         try:
             dest.unlink()
@@ -78,19 +93,32 @@ class Linker:
             pass
         
     def make(self, dest):
-        self.unlink(dest)
-        self.src.link_to(dest)
+        import os
+        tmp = self.get_tmp(dest)
+        self.unlink(tmp)
+        os.link(self.src, tmp)
+        try:
+            os.replace(tmp, dest)
+        finally:
+            # rename() does nothing if both are the same file
+            self.unlink(tmp)
 
 class WinLinker(Linker):
     def make(self, dest):
         # FIXME: use elevate + symlink on Windows?
         # https://stackoverflow.com/questions/6260149/os-symlink-support-in-windows
         # create a BAT file on windows
+        import os
         dest = dest.with_suffix(".bat")
-        self.unlink(dest)
         content = "\n".join([
             "@echo off",
             '"{}" %*'.format(self.src)
         ])
-        dest.write_text(content)
+        tmp = self.get_tmp(dest)
+        tmp.write_text(content)
+        try:
+            os.replace(tmp, dest)
+        except OSError:
+            self.unlink(tmp)
+            raise
         
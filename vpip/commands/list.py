@@ -10,6 +10,11 @@ options = [
         "name": ["--outdated"],
         "action": "store_true",
         "help": "List outdated packages only"
+    },
+    {
+        "name": ["--offline"],
+        "action": "store_true",
+        "help": "Check updates from the metadata cache without network access"
     }
 ]
 
@@ -20,21 +25,21 @@ def run(ns):
         print_local_packages(check_outdated=ns.outdated)
         
 def iter_global_packages():
-    """Iterate through globally installed packages.
+    """Iterate through globally installed packages. Package information is
+    read from the registry. See :func:`vpip.registry.get_entries`.
     
     :rtype: Iterator[PackageInfo]
     """
-    from packaging.requirements import Requirement
-    from .. import venv, pip_api
-    for dir_name in venv.iter_global_packages():
-        vv = venv.get_global_pkg_venv(dir_name)
-        with vv.activate():
-            req = Requirement(dir_name)
-            yield PackageInfo(req.name, pip_api.get_pkg_info(req.name, cache=False).version)
+    from .. import registry
+    for entry in registry.get_entries().values():
+        yield PackageInfo(entry["name"], entry["version"])
             
 def print_global_packages(check_outdated=False):
-    for info in iter_global_packages():
-        if check_outdated and not info.check_update():
+    infos = iter_global_packages()
+    if check_outdated:
+        infos = check_updates(infos)
+    for info in infos:
+        if check_outdated and not info.update_result:
             continue
         print(info)
         
@@ -46,35 +51,49 @@ def print_local_packages(check_outdated=False):
     prod_requires = list(dependency.get_prod_requires())
     
     installed = {}
-    with vv.activate():
+    with vv.activate(lock="shared"):
         for info in pip_api.list_():
             installed[canonicalize_name(info.name)] = info.version
             
-    def get_infos(requires):
-        for require in requires:
-            info = PackageInfo(
-                require.name,
-                installed.get(canonicalize_name(require.name))
-            )
-            if check_outdated and not info.check_update():
-                continue
-            yield info
+    infos = [
+        PackageInfo(require.name, installed.get(canonicalize_name(require.name)))
+        for require in dev_requires + prod_requires
+    ]
+    if check_outdated:
+        infos = check_updates(infos)
         
     dev_count = 0
-    for info in get_infos(dev_requires):
-        if not dev_count:
-            print("-- Dev dependency --")
-        print(str(info))
-        dev_count += 1
-    
     prod_count = 0
-    for info in get_infos(prod_requires):
-        if dev_count and not prod_count:
-            print("")
-        if not prod_count:
-            print("-- Prod dependency --")
+    for i, info in enumerate(infos):
+        if check_outdated and not info.update_result:
+            continue
+        if i < len(dev_requires):
+            if not dev_count:
+                print("-- Dev dependency --")
+            dev_count += 1
+        else:
+            if dev_count and not prod_count:
+                print("")
+            if not prod_count:
+                print("-- Prod dependency --")
+            prod_count += 1
         print(str(info))
-        prod_count += 1
+        
+def check_updates(infos):
+    """Check updates of multiple packages concurrently and setup
+    :attr:`PackageInfo.update_result`. See :func:`vpip.pypi.check_updates`.
+    
+    :arg Iterable[PackageInfo] infos: Package information.
+    :return: A generator yielding ``infos`` in the same order, as soon as
+        the update results are ready.
+    :rtype: Iterator[PackageInfo]
+    """
+    from .. import pypi
+    infos = list(infos)
+    results = pypi.check_updates((info.name, info.version) for info in infos)
+    for info, result in zip(infos, results):
+        info.update_result = result
+        yield info
 
 class PackageInfo:
     """Package information formatter.
@@ -9,6 +9,11 @@ options = [
         "dest": "global_",
         "action": "store_true",
         "help": "List globally installed packages"
+    },
+    {
+        "name": ["--offline"],
+        "action": "store_true",
+        "help": "Check updates from the metadata cache without network access"
     }
 ]
 
@@ -6,11 +6,14 @@ allow_unknown = True
 
 def run(ns, extra):
     from subprocess import list2cmdline, CalledProcessError
-    from .. import venv
+    from .. import venv, dependency
     from ..execute import execute
     
     vv = venv.get_current_venv()
-    with vv.activate():
+    if dependency.check_stamp(vv.env_dir) is False:
+        print("the venv is out of date. Run `vpip install` or `vpip sync` to update it", file=sys.stderr)
+    # don't block other commands while a long-running process is running
+    with vv.activate(lock=None):
         if extra and extra[0] == "--":
             extra = extra[1:]
         if not extra:
@@ -0,0 +1,23 @@
+help = "Manage the package store"
+options = [
+    {
+        "name": "ACTION",
+        "choices": ["prune"],
+        "help": "prune: remove packages that are not used by any venv"
+    }
+]
+
+def run(ns):
+    if ns.ACTION == "prune":
+        prune()
+
+def prune():
+    """Remove unreferenced packages from the store. See
+    :func:`vpip.store.prune`."""
+    import os
+    from .. import store
+    removed = store.prune()
+    for folder in removed:
+        print("removed {}".format(os.path.relpath(folder, store.STORE_FOLDER)))
+    if not removed:
+        print("Nothing to remove")
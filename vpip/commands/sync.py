@@ -0,0 +1,113 @@
+from typing import List, Tuple
+
+help = "Install and uninstall packages to match the lock file"
+options = [
+    {
+        "name": ["--dry-run"],
+        "action": "store_true",
+        "help": "Print packages that would be installed or uninstalled without changing the venv"
+    },
+    {
+        "name": ["--offline"],
+        "action": "store_true",
+        "help": "Install packages from the wheelhouse without network access"
+    }
+]
+
+def run(ns):
+    sync(dry_run=ns.dry_run)
+
+def get_changes(locked: List[tuple], graph) -> Tuple[List[tuple], list]:
+    """Compare the lock file with installed packages.
+
+    Editable packages and :data:`vpip.venv.PREINSTALLED_PACKAGES` are
+    ignored.
+
+    :arg locked: Entries returned by :func:`vpip.dependency.read_lock`.
+    :arg vpip.pip_api.InspectGraph graph: Installed packages.
+    :return: A tuple ``(install, uninstall)``. ``install`` is a list of lock
+        entries that are missing or have a different version. ``uninstall``
+        is a list of :class:`vpip.pip_api.Package` that are not in the lock
+        file.
+    """
+    from packaging.utils import canonicalize_name
+    from ..venv import PREINSTALLED_PACKAGES
+    ignored = set(canonicalize_name(n) for n in PREINSTALLED_PACKAGES)
+    install = []
+    names = set()
+    for req, line in locked:
+        name = canonicalize_name(req.name)
+        if name in ignored:
+            continue
+        names.add(name)
+        pkg = graph.packages.get(name)
+        if pkg and pkg.editable:
+            continue
+        if pkg and req.specifier.contains(pkg.version, prereleases=True):
+            continue
+        install.append((req, line))
+    uninstall = [
+        pkg for name, pkg in sorted(graph.packages.items())
+        if name not in names and name not in ignored and not pkg.editable
+    ]
+    return install, uninstall
+
+def print_changes(install: List[tuple], uninstall: list, graph):
+    """Print changes returned by :func:`get_changes`."""
+    from packaging.utils import canonicalize_name
+    for req, _line in install:
+        pkg = graph.packages.get(canonicalize_name(req.name))
+        if pkg:
+            print("update {} {} -> {}".format(pkg.name, pkg.version, str(req.specifier).lstrip("=")))
+        else:
+            print("install {}".format(req))
+    for pkg in uninstall:
+        print("uninstall {} {}".format(pkg.name, pkg.version))
+
+def sync(dry_run=False):
+    """Install and uninstall packages in the local venv so it matches the
+    lock file.
+
+    Only the difference is applied, with a single ``pip uninstall`` and a
+    single ``pip install --no-deps``. If the lock file has hashes,
+    ``--require-hashes`` is used. See :func:`get_changes`.
+
+    :arg bool dry_run: Print changes and do nothing.
+    """
+    from .. import venv, pip_api, dependency, store
+
+    if not dependency.has_lock():
+        raise Exception("no lock file. Run `vpip install` first")
+    locked = dependency.read_lock()
+    vv = venv.get_current_venv()
+    with vv.activate(not dry_run, lock="shared" if dry_run else "exclusive"):
+        graph = pip_api.inspect()
+        install, uninstall = get_changes(locked, graph)
+        if not install and not uninstall:
+            print("already in sync")
+            if not dry_run:
+                dependency.write_stamp(vv.env_dir)
+            return
+        print_changes(install, uninstall, graph)
+        if dry_run:
+            return
+        pip_api.uninstall([pkg.name for pkg in uninstall])
+        if install:
+            install_locked([line for _req, line in install])
+            store.link_packages(req.name for req, _line in install)
+        dependency.write_stamp(vv.env_dir)
+
+def install_locked(lines: List[str]):
+    """Install lock entries with ``pip install --no-deps``."""
+    import os
+    import tempfile
+    from pathlib import Path
+    from .. import pip_api, dependency
+    fd, file = tempfile.mkstemp(prefix="vpip-sync-", suffix=".txt")
+    os.close(fd)
+    try:
+        Path(file).write_text("\n".join(lines), encoding="utf8")
+        pip_api.install_requirements(
+            file, require_hashes=dependency.has_lock_hashes(), deps=False)
+    finally:
+        pip_api.remove_file(file)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterable, List
 from .link import get_current_pkg
 
 help = "Uninstall packages and delete from dependencies"
@@ -9,6 +9,12 @@ options = [
         "action": "store_true",
         "help": "Remove packages from the global folder"
     },
+    {
+        "name": ["--dry-run"],
+        "action": "store_true",
+        "help": "Print packages that would be removed without uninstalling them. "
+                "Only works with local packages"
+    },
     {
         "name": "PACKAGE",
         "nargs": "+",
@@ -20,33 +26,42 @@ def run(ns):
     if ns.global_:
         uninstall_global(ns.PACKAGE)
     else:
-        uninstall_local(ns.PACKAGE)
+        uninstall_local(ns.PACKAGE, dry_run=ns.dry_run)
     
 def uninstall_global(packages):
     """Uninstall global packages.
     
     :arg list[str] packages: Package names.
     """
-    from .. import venv
+    from .. import venv, registry
 
     for pkg in packages:
         print("removing {}...".format(pkg))
         venv.get_global_pkg_venv(pkg).destroy()
+    registry.remove(packages)
     
-def uninstall_local(packages):
+def uninstall_local(packages, dry_run=False):
     """Uninstall packages and remove from dependencies.
     
+    Packages that are no longer reachable from dependencies are also removed.
+    All packages are removed with a single ``pip uninstall``.
+    
     :arg list[str] packages: Package names.
+    :arg bool dry_run: Print packages that would be removed and do nothing.
     """
     from .. import venv, pip_api, dependency
+    from .install import update_lock
 
     vv = venv.get_current_venv()
     with vv.activate():
         top_packages = filter_top_packages(packages)
-        pip_api.uninstall(top_packages)
+        if dry_run:
+            print_removal(set(top_packages).union(get_unused(removed=packages)))
+            return
         dependency.delete(packages)
-        clean_unused()
-        dependency.update_lock()
+        pip_api.uninstall(sorted(set(top_packages).union(get_unused())))
+        update_lock()
+        dependency.write_stamp(vv.env_dir)
         
 def filter_top_packages(packages: List[str]) -> List[str]:
     """Return top-level packages"""
@@ -56,25 +71,56 @@ def filter_top_packages(packages: List[str]) -> List[str]:
     return [pkg.name for pkg in pkg_infos
             if not pkg.required_by or pkg.required_by == {current_pkg}]
 
-def clean_unused():
-    """Remove unused packages"""
+def get_unused(removed: Iterable[str] = ()) -> List[str]:
+    """Find installed packages that are not reachable from dependencies.
+    
+    Roots of the graph are development/production dependencies,
+    :data:`~vpip.venv.PREINSTALLED_PACKAGES`, and editable packages.
+    
+    :arg removed: Package names that should not be treated as roots, e.g.
+        dependencies that are going to be removed.
+    :return: Package names.
+    """
+    from packaging.utils import canonicalize_name
     from .. import pip_api, dependency
     from ..venv import PREINSTALLED_PACKAGES
-    deps = []
-    for req in dependency.get_dev_requires():
-        deps.append(req.name)
-    for req in dependency.get_prod_requires():
-        deps.append(req.name)
-    used = set(pkg.name for pkg in pip_api.get_pkg_infos(deps))
-        
-    def get_unused():
-        return [
-            pkg.name for pkg in pip_api.list_(not_required=True)
-            if pkg.name not in used and pkg.name not in PREINSTALLED_PACKAGES
-        ]
-        
+    graph = pip_api.inspect()
+    removed = set(canonicalize_name(name) for name in removed)
+    roots = [
+        *(r.name for r in dependency.get_dev_requires()),
+        *(r.name for r in dependency.get_prod_requires()),
+        *PREINSTALLED_PACKAGES
+    ]
+    used = set(pkg for pkg in graph.packages.values() if pkg.editable)
+    for name in roots:
+        name = canonicalize_name(name)
+        if name in graph.packages and name not in removed:
+            used.add(graph.packages[name])
+    for pkg in list(used):
+        used.update(graph.get_dependencies(pkg))
+    return sorted(pkg.name for pkg in graph.packages.values() if pkg not in used)
+
+def clean_unused(dry_run=False) -> List[str]:
+    """Remove unused packages with a single ``pip uninstall``. See
+    :func:`get_unused`.
+    
+    :arg bool dry_run: Print packages that would be removed and do nothing.
+    :return: Removed package names.
+    """
+    from .. import pip_api
     unused = get_unused()
-    while unused:
+    if dry_run:
+        print_removal(unused)
+    else:
         pip_api.uninstall(unused)
-        unused = get_unused()
-        
+    return unused
+
+def print_removal(packages: Iterable[str]):
+    """Print packages that would be removed."""
+    packages = sorted(packages)
+    if not packages:
+        print("Nothing to remove")
+        return
+    print("Would remove:")
+    for name in packages:
+        print("  {}".format(name))
@@ -15,26 +15,43 @@ options = [
         "action": "store_true",
         "help": "Install the latest version even if the new version is not compatible"
     },
+    {
+        "name": ["-j", "--jobs"],
+        "type": int,
+        "default": 1,
+        "help": "Number of global packages processed concurrently (default: 1)"
+    },
     {
         "name": "PACKAGE",
         "nargs": "*",
         "help": "Package name"
+    },
+    {
+        "name": ["--offline"],
+        "action": "store_true",
+        "help": "Install packages from the wheelhouse without network access"
     }
 ]
 
 def run(ns):
-    from .. import venv
+    from .. import venv, dependency
     
     if ns.global_:
         if ns.PACKAGE:
             packages = ns.PACKAGE
         else:
             packages = list(venv.iter_global_packages())
+        if ns.jobs > 1:
+            from ..execute import execute_jobs
+            args = ["update", "-g", *(["--latest"] if ns.latest else [])]
+            execute_jobs({pkg: [*args, pkg] for pkg in packages}, ns.jobs)
+            return
         install.install_global(packages, upgrade=True, latest=ns.latest)
     else:
         vv = venv.get_current_venv()
         with vv.activate():
             update_local(ns.PACKAGE, latest=ns.latest)
+            dependency.write_stamp(vv.env_dir)
         
 def update_local(packages: List[str], latest: bool = False):
     """Update local packages.
@@ -42,7 +59,7 @@ def update_local(packages: List[str], latest: bool = False):
     :arg packages: A list of packages that shoud be updated.
     :arg latest: Whether to upgrade to the latest version.
     """
-    from .. import dependency, pip_api
+    from .. import dependency, pip_api, store
 
     dev_requires = list(dependency.get_dev_requires())
     prod_requires = list(dependency.get_prod_requires())
@@ -60,7 +77,8 @@ def update_local(packages: List[str], latest: bool = False):
     if missing:
         raise Exception(f"Some packages are not installed: {', '.join(missing)}")
 
-    pip_api.install([*packages, *pip_api.freeze(include=dev_packages | prod_packages, exclude=set(names))], upgrade=True, latest=latest)
+    collected = pip_api.install([*packages, *pip_api.freeze(include=dev_packages | prod_packages, exclude=set(names))], upgrade=True, latest=latest)
+    store.link_packages(collected)
     infos = pip_api.get_pkg_infos(names)
 
     dev_installed = {}
@@ -78,4 +96,4 @@ def update_local(packages: List[str], latest: bool = False):
         install.install_editable()
 
     if any(r.dirty for r in [dev_result, prod_result]):
-        dependency.update_lock()
+        install.update_lock()
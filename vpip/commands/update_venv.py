@@ -6,36 +6,59 @@ options = [
         "dest": "global_",
         "help": "Update global packages",
         "metavar": "PACKAGE"
+    },
+    {
+        "name": ["-j", "--jobs"],
+        "type": int,
+        "default": 1,
+        "help": "Number of global packages processed concurrently (default: 1)"
+    },
+    {
+        "name": ["--no-template"],
+        "action": "store_true",
+        "help": "Don't build the venv template if it is missing"
     }
 ]
 
 def run(ns):
-    from .. import venv
+    from .. import venv, registry
+    if not ns.no_template:
+        venv.update_template()
     if ns.global_ is None:
         update_venv(venv.get_current_venv())
         return
         
+    homes = {}
     if not ns.global_:
-        ns.global_ = venv.iter_global_packages()
+        entries = registry.get_entries()
+        ns.global_ = list(entries)
+        homes = {pkg: entry["home"] for pkg, entry in entries.items()}
+        
+    if ns.jobs > 1:
+        from ..execute import execute_jobs
+        execute_jobs(
+            {pkg: ["update_venv", "--no-template", "-g", pkg] for pkg in ns.global_},
+            ns.jobs
+        )
+        return
         
     for pkg in ns.global_:
-        update_venv(venv.get_global_pkg_venv(pkg), global_pkg_name=pkg)
+        update_venv(venv.get_global_pkg_venv(pkg), global_pkg_name=pkg, home=homes.get(pkg))
     
-def update_venv(vv, global_pkg_name=None):
+def update_venv(vv, global_pkg_name=None, home=None):
     """Update a venv.
     
     :arg vpip.venv.Venv vv: A venv instance.
     :arg str global_pkg_name: Decide how to rebuild the venv. If set then run :func:`vpip.commands.install.install_global` when rebuilding venv. Otherwise, run :func:`vpip.commands.install.install_local_first_time`
+    :arg str home: The ``home`` in ``pyvenv.cfg`` if it is known e.g. from
+        the registry. Otherwise, ``pyvenv.cfg`` is read.
     
     If the Python version is upgraded, this command reinstall the entire venv.
     """
     import sys
     import pathlib
-    import configparser
-    env_dir = pathlib.Path(vv.env_dir)
-    config = configparser.ConfigParser()
-    config.read_string("[DEFAULT]\n" + (env_dir / "pyvenv.cfg").read_text(encoding="utf8"))
-    config_home = pathlib.Path(config.get("DEFAULT", "home"))
+    from ..venv import get_venv_config
+    config_home = pathlib.Path(home or get_venv_config(vv.env_dir)["home"])
     # https://github.com/python/cpython/blob/0118d109d54bf75c99a8b0fa9aeae1a478ac4b7e/Lib/venv/__init__.py#L109
     current_home = pathlib.Path(getattr(sys, '_base_executable', sys.executable)).parent
     if config_home != current_home:
@@ -49,8 +72,15 @@ def update_venv(vv, global_pkg_name=None):
         return
     
     # update pip
-    from .. import pip_api
+    from .. import pip_api, dependency
     from ..venv import PREINSTALLED_PACKAGES
     with vv.activate():
+        # the stamp includes site-packages mtimes, which pip changes
+        fresh = not global_pkg_name and dependency.check_stamp(vv.env_dir)
         pip_api.install(PREINSTALLED_PACKAGES, upgrade=True, latest=True)
+        if fresh:
+            dependency.write_stamp(vv.env_dir)
+    if global_pkg_name:
+        from .. import registry
+        registry.update(global_pkg_name)
     
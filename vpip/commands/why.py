@@ -0,0 +1,50 @@
+help = "Show why a package is installed"
+options = [
+    {
+        "name": "PACKAGE",
+        "help": "Package name"
+    }
+]
+
+def run(ns):
+    from .. import venv
+    vv = venv.get_current_venv()
+    with vv.activate(lock="shared"):
+        print_why(ns.PACKAGE)
+        
+def print_why(pkg):
+    """Print packages that require ``pkg``, and the dependency paths from
+    development/production dependencies to ``pkg``.
+    
+    :arg str pkg: Package name.
+    """
+    from packaging.utils import canonicalize_name
+    from .. import pip_api, dependency
+    graph = pip_api.inspect()
+    target = pip_api.get_pkg_info(pkg)
+    print("{} {}".format(target.name, target.version))
+    
+    required_by = sorted(target.required_by, key=lambda p: p.normalized_name)
+    if required_by:
+        print("Required by:")
+        for parent in required_by:
+            print("  {} {}".format(parent.name, parent.version))
+            
+    roots = {}
+    for require in [*dependency.get_dev_requires(), *dependency.get_prod_requires()]:
+        name = canonicalize_name(require.name)
+        if name in graph.packages:
+            roots[name] = graph.packages[name]
+    roots.update((p.normalized_name, p) for p in graph.packages.values() if p.editable)
+    
+    paths = []
+    for root in roots.values():
+        path = graph.find_path(root, target)
+        if path:
+            paths.append(" -> ".join(p.name for p in path))
+    if paths:
+        print("Dependency paths:")
+        for path in sorted(paths):
+            print("  {}".format(path))
+    elif not required_by:
+        print("Not required by any package")
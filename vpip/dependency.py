@@ -1,19 +1,25 @@
 from abc import abstractmethod
 import configparser
+import hashlib
+import os
 import re
 from collections import OrderedDict
 from pathlib import Path
-from typing import Iterator, List, Union
+from typing import Callable, Iterator, List, Optional, Union
 
 from configupdater import ConfigUpdater
 from packaging.requirements import Requirement
 import tomlkit
 from tomlkit.toml_file import TOMLFile
 
+from .lock import lock
 from .pip_api import get_compatible_version
 
 LOCK_FILE = "requirements-lock.txt"
 
+#: Name of the stamp file in the venv folder. See :func:`get_stamp`.
+STAMP_FILE = ".vpip-stamp"
+
 def parse_requirements(text) -> Iterator[Requirement]:
     """Parse requirements text.
 
@@ -87,8 +93,9 @@ class Updater:
 
 class DevUpdater(Updater):
     """Development dependency (requirements.txt) updater."""
+    file_path = "requirements.txt"
     def __init__(self):
-        self.file = Path("requirements.txt")
+        self.file = Path(self.file_path)
         
     def get_requirements(self):
         try:
@@ -119,6 +126,14 @@ def get_vpip_config() -> dict[str, Union[str, dict]]:
     except OSError:
         return {}
 
+def is_config_enabled(key: str, default: bool = False) -> bool:
+    """Get a boolean option from :func:`get_vpip_config`. Values in
+    ``setup.cfg`` are strings e.g. ``false``."""
+    value = get_vpip_config().get(key, default)
+    if isinstance(value, str):
+        return value.lower() not in ("false", "0", "no", "off", "")
+    return bool(value)
+
 class ProdUpdater(Updater):
     """Production dependency base class"""
     file_path = "" # should be overridden
@@ -269,7 +284,14 @@ def update_dependency(updater, added=None, removed=None):
     :arg Updater updater: An Updater instance.
     :arg dict added: A ``pkg_name -> version`` map. Added packages.
     :arg list[str] removed: A list of package name. Removed packages.
+    
+    The dependency file is locked while it is read and written. See
+    :mod:`vpip.lock`.
     """
+    with lock(updater.file_path):
+        return _update_dependency(updater, added, removed)
+        
+def _update_dependency(updater, added, removed):
     added = added or {}
     removed = set(removed or [])
     output = []
@@ -306,12 +328,94 @@ def has_lock() -> bool:
     """Detect if there is a lock file (requirements-lock.txt)"""
     return Path(LOCK_FILE).exists()
         
-def update_lock():
-    """Run ``pip freeze`` and update the lock file"""
+def has_lock_hashes() -> bool:
+    """Detect if the lock file pins packages with hashes. See
+    :func:`update_lock`."""
+    try:
+        return "--hash=" in Path(LOCK_FILE).read_text(encoding="utf8")
+    except OSError:
+        return False
+        
+def read_lock() -> List[tuple]:
+    """Read the lock file.
+    
+    :return: A list of ``(requirement, line)`` tuples. ``requirement`` is a
+        :class:`packaging.requirements.Requirement` and ``line`` is the
+        entry in the lock file, including ``--hash`` options.
+    """
+    text = Path(LOCK_FILE).read_text(encoding="utf8")
+    result = []
+    for line in re.sub(r"\\\r?\n", " ", text).splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        result.append((Requirement(line.split()[0]), " ".join(line.split())))
+    return result
+    
+def update_lock(format_lock: Optional[Callable[[List[str]], Optional[str]]] = None):
+    """Run ``pip freeze`` and update the lock file.
+    
+    :arg format_lock: A function converting ``pip freeze`` lines to the
+        content of the lock file e.g. :func:`vpip.pypi.format_hashed_lock`.
+        If it is not defined or returns None, lines are written as is.
+    """
     from . import pip_api
     from .venv import PREINSTALLED_PACKAGES
     lines = pip_api.freeze(exclude=PREINSTALLED_PACKAGES)
-    Path(LOCK_FILE).write_text("\n".join(lines), encoding="utf8")
+    text = format_lock(lines) if format_lock else None
+    if text is None:
+        text = "\n".join(lines)
+    with lock(LOCK_FILE):
+        Path(LOCK_FILE).write_text(text, encoding="utf8")
+
+def get_stamp(env_dir: str) -> str:
+    """Compute the stamp of the local venv.
+    
+    The stamp is a hash of the lock file, ``requirements.txt``, production
+    dependencies, ``pyvenv.cfg``, the identity of the base interpreter (see
+    :func:`vpip.venv.get_python_id`), and modification times of
+    site-packages folders. If it matches the stamp
+    written by :func:`write_stamp`, the venv is up to date.
+    
+    :arg env_dir: The venv folder.
+    """
+    from . import venv
+    h = hashlib.sha256()
+    for file in [LOCK_FILE, DevUpdater.file_path, os.path.join(env_dir, "pyvenv.cfg")]:
+        try:
+            data = Path(file).read_bytes()
+        except OSError:
+            data = b""
+        h.update(hashlib.sha256(data).digest())
+    try:
+        # pyvenv.cfg doesn't change when the interpreter is upgraded in place
+        executable = venv.get_venv_config(env_dir).get("executable")
+        h.update(venv.get_python_id(executable).encode("utf8"))
+    except OSError:
+        pass
+    h.update(get_prod_updater().get_requirements().encode("utf8"))
+    for folder in venv.get_site_packages(env_dir):
+        try:
+            h.update(str(os.stat(folder).st_mtime_ns).encode("utf8"))
+        except OSError:
+            pass
+    return h.hexdigest()
+
+def write_stamp(env_dir: str):
+    """Write :func:`get_stamp` to :data:`STAMP_FILE` in the venv. It should
+    be called after the venv is synced with dependency files."""
+    Path(env_dir, STAMP_FILE).write_text(get_stamp(env_dir), encoding="utf8")
+
+def check_stamp(env_dir: str) -> Optional[bool]:
+    """Check if the venv is up to date. See :func:`get_stamp`.
+    
+    :return: None if the stamp doesn't exist.
+    """
+    try:
+        stamp = Path(env_dir, STAMP_FILE).read_text(encoding="utf8")
+    except OSError:
+        return None
+    return stamp == get_stamp(env_dir)
 
 def add_dev(packages):
     return update_dependency(DevUpdater(), added=packages)
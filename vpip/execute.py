@@ -1,7 +1,17 @@
+import json
+import os
+import queue
+import secrets
 import subprocess
 import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
 
-def execute(cmd, capture=False):
+def execute(cmd, capture=False, env=None):
     """Execute a command.
     
     :arg cmd: Command. If ``cmd`` is a :class:`str`, the command would be
@@ -10,16 +20,18 @@ def execute(cmd, capture=False):
     :arg bool capture: If ``True`` then enter the capture mode: process output
         will be captured and the function will return a generator yielding
         lines of the output.
+    :arg dict env: Environment variables of the process. The executable is
+        also searched in its ``PATH``. Default to :data:`os.environ`.
     :rtype: Iterator[str] or None
     """
     def do_execute():
         stdout = subprocess.PIPE if capture else None
         shell = isinstance(cmd, str)
         if not shell:
-            executable = shutil.which(cmd[0])
+            executable = shutil.which(cmd[0], path=env.get("PATH") if env else None)
             if executable:
                 cmd[0] = executable
-        with subprocess.Popen(cmd, stdout=stdout, encoding="utf8", shell=shell) as process:
+        with subprocess.Popen(cmd, stdout=stdout, encoding="utf8", shell=shell, env=env) as process:
             if capture:
                 yield from process.stdout
         if process.returncode:
@@ -28,3 +40,216 @@ def execute(cmd, capture=False):
         return do_execute()
     list(do_execute())
     
+def execute_jobs(jobs: Dict[str, List[str]], max_workers: int):
+    """Execute ``python -m vpip`` commands concurrently in subprocesses.
+    
+    Each line of the output is prefixed with ``[name]`` and printed as soon as
+    it is received, so outputs of different jobs don't interleave within a
+    line. A summary is printed after all jobs are finished.
+    
+    :arg jobs: A ``name -> args`` map. ``args`` are vpip arguments e.g.
+        ``["update", "-g", "black"]``.
+    :arg max_workers: Max number of concurrent jobs.
+    :raises Exception: If any job failed.
+    """
+    lock = threading.Lock()
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    def run(name, args):
+        cmd = [sys.executable, "-X", "utf8", "-m", "vpip", *args]
+        with subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+                encoding="utf8", errors="replace") as process:
+            for line in process.stdout:
+                with lock:
+                    print("[{}] {}".format(name, line), end="", flush=True)
+        return process.returncode
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(run, name, args) for name, args in jobs.items()}
+    failed = [name for name, future in futures.items() if future.result()]
+    print("{} succeeded, {} failed".format(len(jobs) - len(failed), len(failed)))
+    if failed:
+        for name in failed:
+            print("  {}".format(name))
+        raise Exception("some jobs failed: {}".format(", ".join(failed)))
+
+
+class PipWorker:
+    """A long-lived pip process for a Python interpreter.
+    
+    The worker imports pip once, then forks a child for each command, so the
+    interpreter startup and pip import cost is only paid once. See
+    :mod:`vpip.pip_worker`. It only works on platforms supporting
+    :func:`os.fork`.
+    """
+    def __init__(self, python):
+        """
+        :arg str python: Path to the Python executable.
+        """
+        self.python = python
+        self.lock = threading.Lock()
+        self.token = "vpip-worker-{}".format(secrets.token_hex(8))
+        source = Path(__file__).with_name("pip_worker.py").read_text(encoding="utf8")
+        self.process = subprocess.Popen( # pylint: disable=consider-using-with
+            [python, "-X", "utf8", "-c", source, self.token],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding="utf8"
+        )
+        ready = self.process.stdout.readline()
+        if ready != "{} ready\n".format(self.token):
+            self.close()
+            raise OSError("failed to start pip worker for {}".format(python))
+            
+    def alive(self):
+        """Check if the worker is still running.
+        
+        :rtype: bool
+        """
+        return self.process.poll() is None
+        
+    def execute(self, args, env=None):
+        """Run a pip command. Commands sent from multiple threads are run one
+        after another.
+        
+        :arg list[str] args: pip arguments e.g. ``["install", "foo"]``.
+        :arg dict env: Environment variables of the command. Default to
+            :data:`os.environ`.
+        :return: A generator yielding lines of the output. It raises
+            :class:`subprocess.CalledProcessError` after the output is
+            consumed if the command failed.
+        :rtype: Iterator[str]
+        
+        The output is read by a thread (see :meth:`pump`), which releases
+        the worker when the command finishes, even if the generator is
+        abandoned.
+        """
+        request = {"args": args, "cwd": os.getcwd(), "env": dict(os.environ if env is None else env)}
+        self.lock.acquire() # pylint: disable=consider-using-with
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        except BaseException:
+            self.lock.release()
+            raise
+        lines = queue.Queue()
+        threading.Thread(target=self.pump, args=(lines,), daemon=True).start()
+        return iter_output(lines, args)
+        
+    def pump(self, lines):
+        """Put output lines of the current command into a queue, followed by
+        the exit code, then release :attr:`lock`."""
+        code = 1
+        try:
+            output = self.read_output()
+            while True:
+                try:
+                    lines.put(next(output))
+                except StopIteration as err:
+                    code = err.value
+                    break
+        finally:
+            self.lock.release()
+            lines.put(code)
+        
+    def read_output(self):
+        """Yield output lines of the current command and return the exit
+        code."""
+        code = None
+        try:
+            for line in self.process.stdout:
+                index = line.find(self.token)
+                if index < 0:
+                    yield line
+                    continue
+                if index:
+                    yield line[:index]
+                code, restart = line[index + len(self.token):].split()
+                code = int(code)
+                if restart == "1":
+                    self.close()
+                break
+        finally:
+            if code is None:
+                # the worker died or the output is not consumed
+                self.close(kill=True)
+        if code is None:
+            code = 1
+        return code
+        
+    def close(self, kill=False):
+        """Stop the worker.
+        
+        :arg bool kill: Kill the worker instead of waiting for the current
+            command.
+        """
+        if kill:
+            self.process.kill()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+        self.process.stdout.close()
+        
+def iter_output(lines, args):
+    """Yield lines from :meth:`PipWorker.pump` and raise
+    :class:`subprocess.CalledProcessError` if the command failed."""
+    while True:
+        line = lines.get()
+        if isinstance(line, int):
+            break
+        yield line
+    if line:
+        raise subprocess.CalledProcessError(line, ["pip", *args])
+        
+pip_workers = None
+pip_workers_lock = threading.Lock()
+
+@contextmanager
+def use_pip_workers():
+    """A context manager. :func:`vpip.pip_api.execute_pip` would use
+    :class:`PipWorker` inside the context, and workers are stopped when
+    exited. Nested calls share the same workers.
+    """
+    global pip_workers
+    if pip_workers is not None:
+        yield
+        return
+    pip_workers = {}
+    try:
+        yield
+    finally:
+        workers, pip_workers = pip_workers, None
+        for worker in workers.values():
+            worker.close()
+            
+def get_pip_worker(python):
+    """Get the :class:`PipWorker` for a Python executable.
+    
+    :arg str python: Path to the Python executable.
+    :return: None if workers are not enabled (see :func:`use_pip_workers`)
+        or not supported.
+    :rtype: PipWorker or None
+    """
+    if pip_workers is None or not hasattr(os, "fork"):
+        return None
+    with pip_workers_lock:
+        worker = pip_workers.get(python)
+        if worker and worker.alive():
+            return worker
+        try:
+            worker = PipWorker(python)
+        except OSError:
+            return None
+        pip_workers[python] = worker
+        return worker
+    
+def stop_pip_workers(prefix):
+    """Stop workers whose Python executable is inside ``prefix``, e.g. before
+    the venv is removed.
+    
+    :arg str prefix: A folder.
+    """
+    if not pip_workers:
+        return
+    for python in list(pip_workers):
+        if Path(python).is_relative_to(prefix):
+            pip_workers.pop(python).close()
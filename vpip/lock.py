@@ -0,0 +1,172 @@
+"""Advisory file locks, so multiple vpip processes can work on the same venv
+or dependency files safely.
+
+Locks are identified by the path of the guarded resource (e.g. the venv
+folder). The lock file is stored in :data:`LOCK_FOLDER` instead of the
+resource itself. Locks are implemented with :func:`fcntl.flock`. On
+platforms without :mod:`fcntl` (Windows), locking is a no-op.
+
+Within a process, a lock is held by one thread at a time. The owner thread
+can acquire the same lock multiple times. A shared lock can't be
+upgraded to an exclusive lock since ``flock`` releases the shared lock
+before the conversion, which would let other processes take the lock in
+between.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#: Folder of lock files ``~/.vpip/locks``.
+LOCK_FOLDER: str = os.path.normpath(os.path.expanduser("~/.vpip/locks"))
+
+#: Default number of seconds to wait for a lock. It can be changed with the
+#: ``VPIP_LOCK_TIMEOUT`` environment variable.
+DEFAULT_TIMEOUT = 600
+
+class HeldLock:
+    """The lock of a resource in this process. It is held by one thread at a
+    time, so threads exclude each other like processes do.
+
+    :ivar mutex: A :class:`threading.Lock` acquired before the file lock.
+    :ivar owner: The ident of the thread holding the lock.
+    :ivar fd: The locked file descriptor.
+    :ivar count: Re-entry count of the owner thread.
+    :ivar users: Number of threads holding or waiting for the lock. The
+        object is removed from :data:`held_locks` when it drops to zero.
+    """
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.owner: Optional[int] = None
+        self.fd: Optional[int] = None
+        self.exclusive = False
+        self.count = 0
+        self.users = 0
+
+#: Locks of this process, keyed by the resource path.
+held_locks: Dict[str, HeldLock] = {}
+#: Guards :data:`held_locks`. It is never held while waiting for a lock.
+held_locks_lock = threading.Lock()
+
+def get_lock_file(path: str) -> str:
+    """Get the lock file of a resource."""
+    key = hashlib.sha256(os.path.abspath(path).encode("utf8")).hexdigest()[:32]
+    return os.path.join(LOCK_FOLDER, key + ".lock")
+
+def get_timeout() -> float:
+    """Get the lock timeout. See :data:`DEFAULT_TIMEOUT`."""
+    try:
+        return float(os.environ.get("VPIP_LOCK_TIMEOUT", DEFAULT_TIMEOUT))
+    except ValueError:
+        return DEFAULT_TIMEOUT
+
+def flock(fd: int, exclusive: bool, path: str, timeout: float):
+    """Acquire ``flock`` with a timeout. A message is printed to stderr if
+    the lock is held by another process."""
+    mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    start = time.monotonic()
+    waiting = False
+    while True:
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            pass
+        else:
+            if waiting:
+                print("acquired lock on {} after {:.1f}s".format(path, time.monotonic() - start), file=sys.stderr)
+            return
+        if not waiting:
+            print("waiting for {} lock on {}...".format(
+                "exclusive" if exclusive else "shared", path), file=sys.stderr)
+            waiting = True
+        if time.monotonic() - start >= timeout:
+            raise TimeoutError("timed out waiting for lock on {}".format(path))
+        time.sleep(0.1)
+
+def acquire(held: HeldLock, path: str, exclusive: bool, timeout: float):
+    """Acquire the thread mutex, then the file lock, of a resource."""
+    start = time.monotonic()
+    if not held.mutex.acquire(timeout=timeout):
+        raise TimeoutError("timed out waiting for lock on {}".format(path))
+    try:
+        os.makedirs(LOCK_FOLDER, exist_ok=True)
+        fd = os.open(get_lock_file(path), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            flock(fd, exclusive, path, max(0, timeout - (time.monotonic() - start)))
+        except BaseException:
+            os.close(fd)
+            raise
+    except BaseException:
+        held.mutex.release()
+        raise
+    held.fd = fd
+    held.exclusive = exclusive
+    held.owner = threading.get_ident()
+    held.count = 1
+
+def release_user(path: str, held: HeldLock):
+    """Unregister a thread using the lock."""
+    with held_locks_lock:
+        held.users -= 1
+        if not held.users:
+            del held_locks[path]
+
+@contextmanager
+def lock(path: str, exclusive: bool = True, timeout: Optional[float] = None):
+    """A context manager acquiring the lock of a resource.
+
+    :arg path: Path to the resource.
+    :arg exclusive: Acquire an exclusive lock. Otherwise, acquire a shared
+        lock, which can be held by multiple processes at the same time.
+        Threads of the same process always exclude each other.
+    :arg timeout: Max number of seconds to wait. Default to
+        :func:`get_timeout`.
+    :raises TimeoutError: If the lock can't be acquired in time.
+    :raises RuntimeError: If an exclusive lock is requested while this
+        thread holds a shared lock.
+    """
+    if fcntl is None:
+        yield
+        return
+    path = os.path.abspath(path)
+    if timeout is None:
+        timeout = get_timeout()
+    with held_locks_lock:
+        held = held_locks.get(path)
+        if held is None:
+            held = held_locks[path] = HeldLock()
+        reentrant = held.owner == threading.get_ident()
+        if reentrant and exclusive and not held.exclusive:
+            raise RuntimeError("can't upgrade the shared lock on {} to an exclusive lock".format(path))
+        if not reentrant:
+            held.users += 1
+    if reentrant:
+        # only the owner thread touches the count
+        held.count += 1
+        try:
+            yield
+        finally:
+            held.count -= 1
+        return
+    try:
+        acquire(held, path, exclusive, timeout)
+    except BaseException:
+        release_user(path, held)
+        raise
+    try:
+        yield
+    finally:
+        os.close(held.fd)
+        held.fd = held.owner = None
+        held.count = 0
+        held.mutex.release()
+        release_user(path, held)
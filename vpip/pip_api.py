@@ -1,29 +1,47 @@
 """``pip`` command API."""
+# pylint: disable=too-many-lines
 
-from collections.abc import Iterator
+from __future__ import annotations
+
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator, Mapping
 import functools
 import json
+import os
+import pathlib
 import re
+import shlex
+import shutil
+import sys
+import tempfile
+import threading
+import time
 from argparse import Namespace
-from typing import List, Optional, Container
+from typing import Callable, List, Optional, Container
 
 from packaging.requirements import Requirement
+from packaging.version import Version
 import packaging.utils
 import case_conversion
 
-from .venv import get_active_venv
-from .execute import execute
+from . import pip_events
+from .venv import Venv, get_active_venv, get_site_packages
+from .execute import execute, get_pip_worker
 
 def install(
     packages: List[str],
     install_scripts: str = None,
     upgrade: bool = False,
     latest: bool = False,
-    deps: bool = True
+    deps: bool = True,
+    *,
+    on_event: Optional[Callable[[tuple], None]] = None,
+    venv: Optional[str] = None
 ) -> List[str]:
     """Install packages and return a list of collected package names.
     
-    :arg packages: A list of package name, which may include the version specifier. It can also be a URL.
+    :arg packages: A list of package name, which may include the version specifier. It can also be a URL or a path to an archive.
     :arg install_scripts: Install scripts to a different folder. It uses
         the ``--install-option="--install-scripts=..."`` pip option.
     :arg upgrade: Upgrade package.
@@ -31,6 +49,12 @@ def install(
         to the compatible version. This option has no effect if ``package``
         includes specifiers.
     :arg deps: Whether to install dependencies.
+    :arg on_event: A callback receiving events defined in
+        :mod:`vpip.pip_events`. If pip supports ``--report``,
+        :class:`~vpip.pip_events.Resolved` events are also sent, before
+        packages are installed.
+    :arg venv: The venv folder. Default to the active venv. See
+        :func:`execute_pip`.
     """
     cmd = "install"
 
@@ -41,115 +65,804 @@ def install(
     if not deps:
         cmd += " --no-deps"
 
+    for spec in get_install_specs(packages, upgrade, latest, venv=venv):
+        cmd += f" {spec}"
+        
+    report_file = None
+    if on_event and supports_report(venv=venv):
+        fd, report_file = tempfile.mkstemp(prefix="vpip-report-", suffix=".json")
+        os.close(fd)
+        cmd += f" --report \"{report_file}\""
+        
+    start = time.time()
+    classifier = pip_events.OutputClassifier()
+    collected = []
+    try:
+        for line in execute_pip(cmd, capture=True, venv=venv):
+            print(line, end="")
+            match = re.match("Installing collected packages:(.+)", line, re.I)
+            if match:
+                collected = [p.strip() for p in match.group(1).split(",")]
+                # pip writes the report before installing
+                send_report(report_file, start, on_event)
+                report_file = None
+            if on_event:
+                for event in classifier.feed(line, time.time() - start):
+                    on_event(event)
+        send_report(report_file, start, on_event)
+    finally:
+        if report_file:
+            remove_file(report_file)
+    refresh_inspect(venv)
+    return collected
+
+#: Extensions of package archives. A spec ending with one of them is treated
+#: as a local file by :func:`get_install_specs`.
+ARCHIVE_EXTENSIONS = (".whl", ".zip", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar")
+
+def is_archive_file(spec: str) -> bool:
+    """Check if a spec is a local archive e.g. a path returned by
+    :func:`vpip.artifacts.download`. A requirement may collide with a file
+    in cwd, so only absolute paths and paths with an archive extension are
+    treated as files."""
+    return (os.path.isabs(spec) or spec.endswith(ARCHIVE_EXTENSIONS)) and os.path.isfile(spec)
+
+def get_install_specs(packages: List[str], upgrade: bool, latest: bool, venv: Optional[str] = None) -> List[str]:
+    """Convert packages to pip arguments. See :func:`install`."""
+    result = []
     for spec in packages:
         if spec.startswith("http"):
-            cmd += " {}".format(spec)
+            result.append(spec)
+            continue
+        if is_archive_file(spec):
+            result.append(f"\"{spec}\"")
             continue
         req = Requirement(spec)
         if upgrade and not latest and not req.specifier:
             # compatible update
-            cmd += f" {req.name}~={get_compatible_version(get_pkg_info(req.name).version)}"
+            result.append(f"{req.name}~={get_compatible_version(get_pkg_info(req.name, venv=venv).version)}")
             continue
-        cmd += f" {spec}"
-        
-    collected = []
-    for line in execute_pip(cmd, capture=True):
-        print(line, end="")
-        match = re.match("Installing collected packages:(.+)", line, re.I)
-        if match:
-            collected = [p.strip() for p in match.group(1).split(",")]
-    return collected
+        result.append(spec)
+    return result
+
+def supports_report(venv: Optional[str] = None) -> bool:
+    """Check if pip in the venv supports ``install --report``."""
+    try:
+        version = get_pkg_info("pip", venv=venv).version
+        return Version(version) >= Version("22.2")
+    except Exception: # pylint: disable=broad-exception-caught
+        return False
+    
+def send_report(report_file: Optional[str], start: float, on_event: Callable[[tuple], None]):
+    """Read the ``--report`` file, send :class:`~vpip.pip_events.Resolved`
+    events, and remove the file."""
+    if not report_file:
+        return
+    try:
+        with open(report_file, encoding="utf8") as f:
+            report = json.load(f)
+        report_time = os.path.getmtime(report_file) - start
+    except (OSError, ValueError):
+        return
+    finally:
+        remove_file(report_file)
+    for event in pip_events.parse_report(report, report_time):
+        on_event(event)
+
+def remove_file(file: str):
+    """Remove a file. Ignore errors."""
+    try:
+        os.remove(file)
+    except OSError:
+        pass
+    
+def install_requirements(file="requirements.txt", venv: Optional[str] = None, require_hashes=False, deps=True):
+    """Install ``requirements.txt`` file.
     
-def install_requirements(file="requirements.txt"):
-    """Install ``requirements.txt`` file."""
-    execute_pip("install -r {}".format(file))
+    :arg venv: The venv folder. Default to the active venv.
+    :arg require_hashes: The file is a complete lock file with hashes. Use
+        ``--require-hashes``, which implies ``--no-deps``.
+    :arg deps: Whether to install dependencies.
+    """
+    cmd = "install --no-deps" if require_hashes or not deps else "install"
+    if require_hashes:
+        cmd += " --require-hashes"
+    execute_pip("{} -r \"{}\"".format(cmd, file), venv=venv)
+    refresh_inspect(venv)
     
-def uninstall(packages):
+def uninstall(packages, venv: Optional[str] = None):
     """Uninstall packages.
     
     :arg list[str] package: Package name.
+    :arg venv: The venv folder. Default to the active venv.
     """
     if not packages:
         return
-    execute_pip("uninstall -y {}".format(" ".join(packages)))
+    execute_pip("uninstall -y {}".format(" ".join(packages)), venv=venv)
+    refresh_inspect(venv)
 
 class Package:
-    """Package information. You can get this object by :func:`get_pkg_info`."""
-    def __init__(self, data):
-        #: Package name.
-        self.name: str = data["metadata"]["name"]
-        #: Normalized package name.
-        self.normalized_name: str = packaging.utils.canonicalize_name(self.name)
-        #: Package version.
-        self.version: str = data["metadata"]["version"]
-        #: Package dependencies
-        self.requires: set[Package] = set()
-        #: Packages that require this
-        self.required_by: set[Package] = set()
-        #: Metadata location
-        self.metadata_location: str = data["metadata_location"]
-
-    @functools.cached_property
+    """Package information. You can get this object by :func:`get_pkg_info`.
+    
+    This is a lightweight view of a node in :class:`InspectGraph`. Two
+    instances are equal if they point to the same node.
+    """
+    __slots__ = ("graph", "id")
+
+    def __init__(self, graph: InspectGraph, node_id: int):
+        #: The graph containing this package.
+        self.graph = graph
+        #: Node id in the graph.
+        self.id = node_id
+
+    def __eq__(self, other):
+        return isinstance(other, Package) and self.graph is other.graph and self.id == other.id
+
+    def __hash__(self):
+        return hash((id(self.graph), self.id))
+
+    def __repr__(self):
+        return "<Package {}=={}>".format(self.name, self.version)
+
+    @property
+    def name(self) -> str:
+        """Package name."""
+        return self.graph.names[self.id]
+
+    @property
+    def normalized_name(self) -> str:
+        """Normalized package name."""
+        return self.graph.normalized_names[self.id]
+
+    @property
+    def version(self) -> str:
+        """Package version."""
+        return self.graph.versions[self.id]
+
+    @property
+    def metadata_location(self) -> str:
+        """Metadata location"""
+        return self.graph.metadata_locations[self.id]
+
+    @property
+    def required_names(self) -> tuple[str, ...]:
+        """Normalized names of dependencies, including packages that are not
+        installed."""
+        return self.graph.required_names[self.id]
+
+    @property
+    def direct_url(self) -> Optional[dict]:
+        """Content of ``direct_url.json``. None if the package is installed
+        from an index."""
+        return self.graph.direct_urls.get(self.id)
+
+    @property
+    def editable(self) -> bool:
+        """Whether the package is installed in editable mode."""
+        direct_url = self.direct_url
+        return bool(direct_url and direct_url.get("dir_info", {}).get("editable"))
+
+    @property
+    def requires(self) -> frozenset[Package]:
+        """Package dependencies"""
+        return frozenset(self.graph.iter_requires(self.id))
+
+    @property
+    def required_by(self) -> frozenset[Package]:
+        """Packages that require this"""
+        return frozenset(self.graph.iter_required_by(self.id))
+
+    @property
     def entry_points(self) -> str:
         """Text content of entry_points.txt. Lazily loaded."""
-        import pathlib
-        try:
-            text = pathlib.Path(self.metadata_location).joinpath("entry_points.txt").read_text(encoding="utf-8")
-        except FileNotFoundError:
-            text = ""
-        return text
+        return self.graph.get_entry_points(self.id)
+
+    def to_dict(self) -> dict:
+        """Convert to a dict in ``pip inspect`` format."""
+        data = {
+            "metadata": {
+                "name": self.name,
+                "version": self.version,
+                "requires_dist": list(self.required_names)
+            },
+            "metadata_location": self.metadata_location
+        }
+        if self.direct_url:
+            data["direct_url"] = self.direct_url
+        return data
+
+class PackageMap(Mapping):
+    """A read-only ``normalized_name -> Package`` map of alive nodes in
+    :class:`InspectGraph`. :class:`Package` views are created on access."""
+    def __init__(self, graph: InspectGraph):
+        self.graph = graph
+
+    def __getitem__(self, key):
+        return Package(self.graph, self.graph.index[key])
+
+    def __contains__(self, key):
+        return key in self.graph.index
+
+    def __iter__(self):
+        return iter(self.graph.index)
+
+    def __len__(self):
+        return len(self.graph.index)
 
 class InspectGraph:
-    """The graph of installed packages."""
-    def __init__(self, installed):
+    """The graph of installed packages.
+    
+    Package data are stored in columns indexed by node id, and dependencies
+    are stored as CSR (compressed sparse row) adjacency arrays. Removed
+    packages leave dead nodes so ids held by :class:`Package` never change.
+    """
+    def __init__(self, installed, fingerprint=None):
+        """
+        :arg list[dict] installed: The ``installed`` list of ``pip inspect``.
+        :arg dict fingerprint: The fingerprint of site-packages when the graph
+            is built. See :func:`get_fingerprint`.
+        """
         #: A dictionary of installed packages.
-        self.packages: dict[packaging.utils.NormalizedName, Package] = {}
-
-        # build packages
-        for data in installed:
-            pkg = Package(data)
-            self.packages[pkg.normalized_name] = pkg
-
-        # build requirements
-        for data in installed:
-            pkg = self.packages[packaging.utils.canonicalize_name(data["metadata"]["name"])]
-            for spec in data["metadata"].get("requires_dist", []):
-                required_name = packaging.utils.canonicalize_name(Requirement(spec).name)
-                required = self.packages.get(required_name)
-                if required:
-                    pkg.requires.add(required)
-                    required.required_by.add(pkg)
-
-inspect_result = {}
-
-def inspect() -> InspectGraph:
-    """Inspect packages. The result is cached according to the active virtual environment."""
-    venv = get_active_venv()
-    if venv not in inspect_result:
-        output = "".join(execute_pip("inspect", capture=True))
-        raw = json.loads(output)
-        assert raw["version"] == "1"
-        inspect_result[venv] = InspectGraph(raw["installed"])
-    return inspect_result[venv]
-
-def get_pkg_infos(names: list[str], cache=True) -> Iterator[Package]:
-    """Get multiple packages information."""
-    graph = inspect()
+        self.packages: Mapping[packaging.utils.NormalizedName, Package] = PackageMap(self)
+        #: The fingerprint of site-packages. None if the graph is built by
+        #: ``pip inspect``.
+        self.fingerprint: Optional[dict[str, int]] = fingerprint
+        #: ``normalized_name -> node id`` map of alive nodes.
+        self.index: dict[str, int] = {}
+        self.names: list[str] = []
+        self.normalized_names: list[str] = []
+        self.versions: list[str] = []
+        self.metadata_locations: list[str] = []
+        self.required_names: list[tuple[str, ...]] = []
+        self.direct_urls: dict[int, dict] = {}
+        self.entry_points: dict[int, str] = {}
+        self.requires_offsets = array("l", [0])
+        self.requires_targets = array("l")
+        self.required_by_offsets = array("l", [0])
+        self.required_by_targets = array("l")
+        # memoized transitive closures. node id -> node ids
+        self.closures: dict[int, frozenset[int]] = {}
+        self.reverse_closures: dict[int, frozenset[int]] = {}
+        self.patch(added=installed)
+
+    def patch(self, added=(), removed=()):
+        """Update the graph in place.
+        
+        :arg list[dict] added: Added packages, in ``pip inspect`` format.
+        :arg list[str] removed: Removed package names.
+        """
+        for name in removed:
+            self.index.pop(packaging.utils.canonicalize_name(name), None)
+
+        for data in added:
+            name = sys.intern(data["metadata"]["name"])
+            normalized_name = sys.intern(packaging.utils.canonicalize_name(name))
+            if normalized_name in self.index:
+                continue
+            node_id = len(self.names)
+            self.index[normalized_name] = node_id
+            self.names.append(name)
+            self.normalized_names.append(normalized_name)
+            self.versions.append(data["metadata"]["version"])
+            self.metadata_locations.append(data["metadata_location"])
+            self.required_names.append(tuple(dict.fromkeys(
+                get_required_name(spec) for spec in data["metadata"].get("requires_dist", [])
+            )))
+            if data.get("direct_url"):
+                self.direct_urls[node_id] = data["direct_url"]
+
+        self.build_edges()
+
+    def build_edges(self):
+        """Build CSR adjacency arrays from :attr:`required_names`."""
+        size = len(self.names)
+        requires_offsets = array("l", [0])
+        requires_targets = array("l")
+        counts = [0] * size
+        for node_id in range(size):
+            if self.index.get(self.normalized_names[node_id]) == node_id:
+                for name in self.required_names[node_id]:
+                    target = self.index.get(name)
+                    if target is not None and target != node_id:
+                        requires_targets.append(target)
+                        counts[target] += 1
+            requires_offsets.append(len(requires_targets))
+
+        required_by_offsets = array("l", [0])
+        for count in counts:
+            required_by_offsets.append(required_by_offsets[-1] + count)
+        required_by_targets = array("l", bytes(required_by_offsets[-1] * required_by_offsets.itemsize))
+        cursor = array("l", required_by_offsets[:-1])
+        for node_id in range(size):
+            for i in range(requires_offsets[node_id], requires_offsets[node_id + 1]):
+                target = requires_targets[i]
+                required_by_targets[cursor[target]] = node_id
+                cursor[target] += 1
+
+        self.requires_offsets = requires_offsets
+        self.requires_targets = requires_targets
+        self.required_by_offsets = required_by_offsets
+        self.required_by_targets = required_by_targets
+        self.closures.clear()
+        self.reverse_closures.clear()
+
+    def iter_requires(self, node_id: int) -> Iterator[Package]:
+        """Iterate through dependencies of a node."""
+        for i in range(self.requires_offsets[node_id], self.requires_offsets[node_id + 1]):
+            yield Package(self, self.requires_targets[i])
+
+    def iter_required_by(self, node_id: int) -> Iterator[Package]:
+        """Iterate through packages that require a node."""
+        for i in range(self.required_by_offsets[node_id], self.required_by_offsets[node_id + 1]):
+            yield Package(self, self.required_by_targets[i])
+
+    def get_dependencies(self, pkg: Package) -> frozenset[Package]:
+        """Get packages that are required by ``pkg`` directly or indirectly.
+        
+        The result is memoized until the graph is patched.
+        """
+        return frozenset(Package(self, i) for i in self.get_closure(
+            pkg.id, self.requires_offsets, self.requires_targets, self.closures))
+
+    def get_dependents(self, pkg: Package) -> frozenset[Package]:
+        """Get packages that require ``pkg`` directly or indirectly.
+        
+        The result is memoized until the graph is patched.
+        """
+        return frozenset(Package(self, i) for i in self.get_closure(
+            pkg.id, self.required_by_offsets, self.required_by_targets, self.reverse_closures))
+
+    def get_closure(self, node_id: int, offsets: array, targets: array, memo: dict[int, frozenset[int]]) -> frozenset[int]:
+        """Get the transitive closure of a node, excluding the node itself.
+        Closures of visited nodes are reused if they are already memoized."""
+        if node_id in memo:
+            return memo[node_id]
+        result = set()
+        stack = [node_id]
+        while stack:
+            current = stack.pop()
+            for i in range(offsets[current], offsets[current + 1]):
+                target = targets[i]
+                if target in result:
+                    continue
+                result.add(target)
+                if target in memo:
+                    result.update(memo[target])
+                else:
+                    stack.append(target)
+        result.discard(node_id)
+        memo[node_id] = frozenset(result)
+        return memo[node_id]
+
+    def find_path(self, source: Package, target: Package) -> Optional[list[Package]]:
+        """Find the shortest dependency path from ``source`` to ``target``.
+        
+        :return: A list of packages starting with ``source`` and ending with
+            ``target``. None if ``source`` doesn't depend on ``target``.
+        """
+        if source == target:
+            return [source]
+        dependents = self.get_dependents(target)
+        if source not in dependents:
+            return None
+        allowed = set(p.id for p in dependents)
+        allowed.add(target.id)
+        parents = {source.id: None}
+        queue = deque([source.id])
+        while queue:
+            current = queue.popleft()
+            if current == target.id:
+                break
+            for i in range(self.requires_offsets[current], self.requires_offsets[current + 1]):
+                node_id = self.requires_targets[i]
+                if node_id in allowed and node_id not in parents:
+                    parents[node_id] = current
+                    queue.append(node_id)
+        path = []
+        node_id = target.id
+        while node_id is not None:
+            path.append(Package(self, node_id))
+            node_id = parents[node_id]
+        return path[::-1]
+
+    def get_entry_points(self, node_id: int) -> str:
+        """Get the text content of entry_points.txt of a node."""
+        if node_id not in self.entry_points:
+            try:
+                text = pathlib.Path(self.metadata_locations[node_id]).joinpath("entry_points.txt").read_text(encoding="utf-8")
+            except FileNotFoundError:
+                text = ""
+            self.entry_points[node_id] = text
+        return self.entry_points[node_id]
+
+    def not_required(self) -> list[Package]:
+        """Get packages that are not required by other installed packages."""
+        return [
+            Package(self, node_id) for node_id in self.index.values()
+            if self.required_by_offsets[node_id] == self.required_by_offsets[node_id + 1]
+        ]
+
+REQUIREMENT_NAME_RX = re.compile(r"\s*([A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)")
+
+@functools.lru_cache(maxsize=4096)
+def get_required_name(spec: str) -> str:
+    """Get the normalized and interned name from a requirement specifier."""
+    match = REQUIREMENT_NAME_RX.match(spec)
+    name = match.group(1) if match else Requirement(spec).name
+    return sys.intern(packaging.utils.canonicalize_name(name))
+
+def read_dist_info(path: str) -> Optional[dict]:
+    """Read a ``*.dist-info`` or ``*.egg-info`` folder.
+    
+    :arg path: Path to the metadata folder.
+    :return: A dict in the same format as the items in the ``installed`` list
+        of ``pip inspect``. Only fields used by vpip are included. Return
+        None if the metadata is broken.
+    """
+    import importlib.metadata
+    dist = importlib.metadata.Distribution.at(path)
+    try:
+        name = dist.metadata["Name"]
+        version = dist.version
+    except (OSError, KeyError):
+        return None
+    if not name or not version:
+        return None
+    data = {
+        "metadata": {
+            "name": name,
+            "version": version,
+            "requires_dist": dist.requires or []
+        },
+        "metadata_location": path
+    }
+    try:
+        direct_url = json.loads(dist.read_text("direct_url.json") or "null")
+    except ValueError:
+        direct_url = None
+    if not direct_url and os.path.basename(os.path.dirname(path)) != "site-packages":
+        # legacy editable install (egg-link or .pth)
+        direct_url = {"url": pathlib.Path(path).parent.as_uri(), "dir_info": {"editable": True}}
+    if direct_url:
+        data["direct_url"] = direct_url
+    return data
+
+def iter_metadata_folders(site_packages: list[str]) -> Iterator[str]:
+    """Iterate through metadata folders in site-packages. Folders added by
+    ``*.pth`` files are also searched, after site-packages.
+    
+    :arg site_packages: A list of site-packages folders.
+    """
+    extra = []
+    for folder in site_packages:
+        for entry in scan_folder(folder):
+            if entry.name.endswith((".dist-info", ".egg-info")):
+                yield entry.path
+            elif entry.name.endswith(".pth") and entry.is_file():
+                extra.extend(read_pth(entry.path))
+    for folder in extra:
+        for entry in scan_folder(folder):
+            if entry.name.endswith((".dist-info", ".egg-info")):
+                yield entry.path
+
+def scan_folder(folder: str) -> list[os.DirEntry]:
+    """List a folder sorted by name. Return an empty list if the folder is
+    not accessible."""
+    try:
+        with os.scandir(folder) as it:
+            return sorted(it, key=lambda e: e.name)
+    except OSError:
+        return []
+
+def read_pth(file: str) -> Iterator[str]:
+    """Yield folders listed in a ``*.pth`` file."""
+    try:
+        with open(file, encoding="utf8") as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(("#", "import ", "import\t")):
+            continue
+        folder = os.path.join(os.path.dirname(file), line)
+        if os.path.isdir(folder):
+            yield os.path.normpath(folder)
+
+def inspect_site_packages(site_packages: list[str]) -> list[dict]:
+    """Inspect installed packages by reading metadata files directly, without
+    invoking pip.
+    
+    :arg site_packages: A list of site-packages folders.
+    :return: A list of dicts in the format of the ``installed`` list of ``pip
+        inspect``. If there are multiple distributions with the same name, the
+        first one wins, which matches the behavior of ``importlib.metadata``.
+    """
+    return read_installed(iter_metadata_folders(site_packages))
+
+def read_installed(paths: Iterable[str]) -> list[dict]:
+    """Read metadata folders. See :func:`inspect_site_packages`."""
+    installed = []
+    found = set()
+    for path in paths:
+        data = read_dist_info(path)
+        if not data:
+            continue
+        name = packaging.utils.canonicalize_name(data["metadata"]["name"])
+        if name in found:
+            continue
+        found.add(name)
+        installed.append(data)
+    return installed
+
+def get_fingerprint(site_packages: list[str], paths: Iterable[str]) -> dict[str, int]:
+    """Get a cheap fingerprint of site-packages.
+    
+    :arg site_packages: A list of site-packages folders.
+    :arg paths: Metadata folders found in site-packages.
+    :return: A ``path -> mtime_ns`` map of site-packages and metadata folders.
+    """
+    result = {}
+    for path in [*site_packages, *paths]:
+        try:
+            result[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    return result
+
+#: Name of the inspect cache file, which is stored in the venv folder.
+INSPECT_CACHE_FILE = ".vpip-inspect.cache"
+
+def load_installed(venv: str, site_packages: list[str], cache: bool = True) -> tuple[list[dict], dict[str, int]]:
+    """Inspect installed packages in site-packages. The result is cached in
+    :data:`INSPECT_CACHE_FILE` and is reused until the fingerprint (see
+    :func:`get_fingerprint`) changes.
+    
+    :arg venv: The venv folder.
+    :arg site_packages: A list of site-packages folders.
+    :arg cache: If False then ignore the cached result.
+    :return: A ``(installed, fingerprint)`` tuple.
+    """
+    paths = list(iter_metadata_folders(site_packages))
+    fingerprint = get_fingerprint(site_packages, paths)
+    cache_file = os.path.join(venv, INSPECT_CACHE_FILE)
+    if cache:
+        try:
+            with open(cache_file, encoding="utf8") as f:
+                data = json.load(f)
+            if data["fingerprint"] == fingerprint:
+                return data["installed"], fingerprint
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    installed = read_installed(paths)
+    write_inspect_cache(venv, installed, fingerprint)
+    return installed, fingerprint
+
+def write_inspect_cache(venv: str, installed: list[dict], fingerprint: dict[str, int]):
+    """Write :data:`INSPECT_CACHE_FILE`."""
+    write_json(os.path.join(venv, INSPECT_CACHE_FILE), {"fingerprint": fingerprint, "installed": installed})
+
+def write_json(file: str, data) -> bool:
+    """Write JSON data to a file atomically.
+    
+    :return: False if failed to write.
+    """
+    tmp_file = "{}.{}.{}.tmp".format(file, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_file, "w", encoding="utf8") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, file)
+    except OSError:
+        remove_file(tmp_file)
+        return False
+    return True
+
+def inspect_pip(venv: Optional[str] = None) -> list[dict]:
+    """Inspect installed packages with ``pip inspect``.
+    
+    :arg venv: The venv folder. Default to the active venv.
+    :return: The ``installed`` list of ``pip inspect``. See
+        :func:`iter_inspect_installed`.
+    """
+    return list(iter_inspect_pip(venv))
+
+def iter_inspect_pip(venv: Optional[str] = None) -> Iterator[dict]:
+    """Run ``pip inspect --local`` and yield installed packages while the
+    output is still being read. Like :func:`inspect_site_packages`, packages
+    outside of the venv (e.g. ``include-system-site-packages``) are excluded.
+    See :func:`iter_inspect_installed`."""
+    return iter_inspect_installed(execute_pip("inspect --local", capture=True, venv=venv))
+
+def iter_inspect_installed(lines: Iterable[str]) -> Iterator[dict]:
+    """Parse the output of ``pip inspect`` incrementally and yield items in
+    the ``installed`` list one by one.
+    
+    Only fields used by vpip are kept: ``metadata.name``,
+    ``metadata.version``, ``metadata.requires_dist``, ``metadata_location``,
+    and ``direct_url``. The remaining lines are consumed after the list is
+    parsed.
+    
+    :arg lines: Lines of the output.
+    """
+    reader = JSONStreamReader(lines)
+    header = {}
+    reader.expect("{")
+    while reader.expect('"}') == '"':
+        reader.pos -= 1
+        key = reader.decode()
+        reader.expect(":")
+        if key != "installed":
+            header[key] = reader.decode()
+        else:
+            assert header.get("version", "1") == "1"
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    data = reader.decode()
+                    item = {
+                        "metadata": {
+                            "name": data["metadata"]["name"],
+                            "version": data["metadata"]["version"],
+                            "requires_dist": data["metadata"].get("requires_dist", [])
+                        },
+                        "metadata_location": data["metadata_location"]
+                    }
+                    if data.get("direct_url"):
+                        item["direct_url"] = data["direct_url"]
+                    yield item
+                    if reader.expect(",]") == "]":
+                        break
+        if reader.expect(",}") == "}":
+            break
+    assert header.get("version") == "1"
+    reader.drain()
+
+class JSONStreamReader:
+    """A helper to decode JSON values from a stream of lines."""
+    def __init__(self, lines: Iterable[str]):
+        self.lines = iter(lines)
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def read_more(self) -> bool:
+        """Read the next line into the buffer. Return False at EOF."""
+        line = next(self.lines, None)
+        if line is None:
+            return False
+        self.buffer = self.buffer[self.pos:] + line
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespaces and return the next character."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                raise ValueError("unexpected end of JSON stream")
+
+    def expect(self, chars: str) -> str:
+        """Consume the next character, which must be one of ``chars``."""
+        char = self.peek()
+        if char not in chars:
+            raise ValueError("expect one of {!r} but got {!r}".format(chars, char))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                # the value is incomplete. Skip lines that can't end a container
+                while True:
+                    if not self.read_more():
+                        raise
+                    if self.buffer.rstrip().rstrip(",").endswith(("}", "]")):
+                        break
+
+    def drain(self):
+        """Consume remaining lines."""
+        for _line in self.lines:
+            pass
+
+#: Maximum number of :class:`InspectGraph` kept in memory by :func:`inspect`.
+INSPECT_CACHE_SIZE = 16
+
+inspect_result: OrderedDict[Optional[str], InspectGraph] = OrderedDict()
+
+#: A lock guarding :data:`inspect_result`, so :func:`inspect` can be called
+#: from multiple threads.
+inspect_lock = threading.RLock()
+
+def inspect(cache: bool = True, venv: Optional[str] = None) -> InspectGraph:
+    """Inspect packages. The result is cached according to the venv folder.
+    
+    Metadata files in site-packages of the venv are read in-process, and the
+    result is also cached in the venv folder (see :func:`load_installed`).
+    If no venv is active (or the venv includes system site-packages), it
+    falls back to ``pip inspect``.
+    
+    :arg cache: If False then ignore cached results and inspect again.
+    :arg venv: The venv folder. Default to the active venv.
+    """
+    if venv is None:
+        venv = get_active_venv()
+    with inspect_lock:
+        if cache and venv in inspect_result:
+            inspect_result.move_to_end(venv)
+            return inspect_result[venv]
+    site_packages = get_site_packages(venv) if venv else []
+    if site_packages:
+        installed, fingerprint = load_installed(venv, site_packages, cache=cache)
+    else:
+        installed, fingerprint = iter_inspect_pip(venv), None
+    graph = InspectGraph(installed, fingerprint)
+    with inspect_lock:
+        inspect_result[venv] = graph
+        inspect_result.move_to_end(venv)
+        while len(inspect_result) > INSPECT_CACHE_SIZE:
+            inspect_result.popitem(last=False)
+    return graph
+
+def refresh_inspect(venv: Optional[str] = None):
+    """Update the cached :class:`InspectGraph` of the venv after pip
+    modified it.
+    
+    Only metadata folders that were added, removed, or changed since the
+    graph was built are read. If the graph is built by ``pip inspect``, the
+    cache is dropped instead.
+    
+    :arg venv: The venv folder. Default to the active venv.
+    """
+    if venv is None:
+        venv = get_active_venv()
+    with inspect_lock:
+        graph = inspect_result.get(venv)
+        if graph is None:
+            return
+        site_packages = get_site_packages(venv) if venv else []
+        if graph.fingerprint is None or not site_packages:
+            del inspect_result[venv]
+            return
+        paths = list(iter_metadata_folders(site_packages))
+        fingerprint = get_fingerprint(site_packages, paths)
+        changed = [path for path in paths if graph.fingerprint.get(path) != fingerprint.get(path)]
+        removed = [
+            pkg.name for pkg in graph.packages.values()
+            if pkg.metadata_location not in fingerprint or pkg.metadata_location in changed
+        ]
+        graph.patch(added=read_installed(changed), removed=removed)
+        graph.fingerprint = fingerprint
+        write_inspect_cache(venv, [pkg.to_dict() for pkg in graph.packages.values()], fingerprint)
+
+def get_pkg_infos(names: list[str], cache=True, venv: Optional[str] = None) -> Iterator[Package]:
+    """Get multiple packages information. See :func:`inspect`."""
+    graph = inspect(cache, venv)
     for pkg in names:
         pkg = packaging.utils.canonicalize_name(pkg)
         if pkg not in graph.packages:
             raise Exception(f"Package {pkg} is not installed")
         yield graph.packages[pkg]
 
-def get_pkg_info(name: str, cache=True) -> Package:
-    """Get package information."""
-    return next(get_pkg_infos([name], cache))
+def get_pkg_info(name: str, cache=True, venv: Optional[str] = None) -> Package:
+    """Get package information. See :func:`inspect`."""
+    return next(get_pkg_infos([name], cache, venv))
     
-def show(packages, verbose=False):
+def show(packages, verbose=False, venv=None):
     """Get package information.
     
     :arg list[str] packages: A list of package name.
     :arg bool verbose: Whether to return verbose info.
+    :arg str venv: The venv folder. Default to the active venv.
     :return: A list of namespace objects holding the package information.
     :rtype: list[Namespace]
     
@@ -167,7 +880,7 @@ def show(packages, verbose=False):
     ns = Namespace()
     last_name = None
     
-    for line in execute_pip("{} {}".format(cmd, " ".join(packages)), True):
+    for line in execute_pip("{} {}".format(cmd, " ".join(packages)), True, venv=venv):
         if line.startswith("---"):
             result.append(ns)
             ns = Namespace()
@@ -191,29 +904,42 @@ def show(packages, verbose=False):
     result.append(ns)
     return result
     
-def list_(not_required=False, format="json"):
-    """List installed packages.
+def list_(not_required=False, format="json", venv=None):
+    """List installed packages, excluding editable packages. It returns the
+    same result as ``pip list --local --exclude-editable --format json`` but
+    is computed from :func:`inspect`.
     
+    :arg bool not_required: Only list packages that are not dependencies of
+        other installed packages.
+    :arg str format: Only ``json`` is supported. Kept for compatibility.
+    :arg str venv: The venv folder. Default to the active venv.
+    :return: A list of namespace objects that have ``name`` and ``version``
+        properties, sorted by normalized name.
     :rtype: list[argparse.Namespace]
     """
-    cmd = "list --local --exclude-editable"
-    if not_required:
-        cmd += " --not-required"
-    cmd += " --format {}".format(format)
-    lines = []
-    for line in execute_pip(cmd, capture=True):
-        lines.append(line)
-    # Note: only the first line is json, other lines include pip upgrade info, etc
-    return [create_ns_from_dict(item) for item in json.loads(lines[0])]
-
-def freeze(include: Optional[Container[str]] = None, exclude: Optional[Container[str]] = None) -> List[str]:
+    if format != "json":
+        raise ValueError("unsupported format: {}".format(format))
+    graph = inspect(venv=venv)
+    packages = graph.not_required() if not_required else graph.packages.values()
+    return [
+        Namespace(name=pkg.name, version=pkg.version)
+        for pkg in sorted(packages, key=lambda p: p.normalized_name)
+        if not pkg.editable
+    ]
+
+def freeze(
+    include: Optional[Container[str]] = None,
+    exclude: Optional[Container[str]] = None,
+    venv: Optional[str] = None
+) -> List[str]:
     """List installed packages in ``pip freeze`` format (``my_pkg==1.2.3``).
 
     :arg include: If defined, only returns specified packages.
     :arg exclude: If defined, exclude specified packages.
+    :arg venv: The venv folder. Default to the active venv.
     """
     result = []
-    for p in list_():
+    for p in list_(venv=venv):
         if include is not None and p.name not in include:
             continue
         if exclude is not None and p.name in exclude:
@@ -232,19 +958,58 @@ def create_ns_from_dict(d):
         setattr(ns, key, value)
     return ns
 
-def execute_pip(cmd, capture=False):
+#: pip commands that never prompt for input.
+NON_INTERACTIVE_COMMANDS = {"inspect", "list", "show", "freeze"}
+
+def may_prompt(args: List[str]) -> bool:
+    """Check if a pip command may prompt for input e.g. credentials of the
+    index, or the confirmation of ``uninstall`` without ``-y``. It is always
+    False if stdin is not a terminal."""
+    if not sys.stdin or not sys.stdin.isatty():
+        return False
+    if not args or args[0] in NON_INTERACTIVE_COMMANDS:
+        return False
+    return not (args[0] == "uninstall" and ("-y" in args or "--yes" in args))
+
+def execute_pip(cmd, capture=False, venv=None):
     """Run pip command.
     
     :arg str cmd: ``pip`` command. It would be prefixed with ``python -m pip``.
     :arg bool capture: Whether to capture output.
+    :arg str venv: Run pip of this venv folder with the environment from
+        :meth:`vpip.venv.Venv.env`, without modifying :data:`os.environ`.
+        Default to the active venv.
+    
+    If pip workers are enabled (see :func:`vpip.execute.use_pip_workers`),
+    the command is sent to the :class:`~vpip.execute.PipWorker` of the
+    ``python`` executable in ``PATH``. Commands that may prompt for input
+    (see :func:`may_prompt`) are run in a new process instead since the
+    worker has no terminal.
     """
+    env = None
+    path = None
+    if venv:
+        env = Venv(venv).env()
+        path = env["PATH"]
+    python = shutil.which("python", path=path)
+    args = shlex.split(cmd)
+    worker = get_pip_worker(python) if python and not may_prompt(args) else None
+    if worker:
+        if capture:
+            args.insert(0, "--no-color")
+        output = worker.execute(args, env=env)
+        if capture:
+            return output
+        for line in output:
+            print(line, end="")
+        return None
     prefix = "python "
     if capture:
         prefix += "-X utf8 "
     prefix += "-m pip "
     if capture:
         prefix += "--no-color "
-    return execute(prefix + cmd, capture)
+    return execute(prefix + cmd, capture, env=env)
     
 def get_compatible_version(version):
     """Return the compatible version.
@@ -0,0 +1,132 @@
+"""Structured events of ``pip install``.
+
+:func:`vpip.pip_api.install` sends these events to the ``on_event``
+callback. Each event is a named tuple and has a ``time`` property, which is
+the number of seconds since the command started.
+"""
+
+import re
+from collections import namedtuple
+from typing import Iterator, List, Optional
+
+import packaging.utils
+from packaging.requirements import InvalidRequirement, Requirement
+
+#: pip starts collecting a requirement.
+Collecting = namedtuple("Collecting", ["name", "spec", "time"])
+#: pip is downloading a file. ``size`` is the number of bytes or None.
+Downloading = namedtuple("Downloading", ["name", "file", "size", "time"])
+#: pip uses a file from its HTTP cache.
+CacheHit = namedtuple("CacheHit", ["name", "file", "size", "time"])
+#: pip uses a local file.
+Processing = namedtuple("Processing", ["name", "file", "time"])
+#: pip is building a wheel.
+BuildingWheel = namedtuple("BuildingWheel", ["name", "time"])
+#: The resolver picked a version. Generated from the ``--report`` file.
+Resolved = namedtuple("Resolved", ["name", "version", "url", "requested", "time"])
+#: A package is installed.
+Installed = namedtuple("Installed", ["name", "version", "time"])
+
+SIZE_UNITS = {
+    "bytes": 1,
+    "b": 1,
+    "kb": 1000,
+    "mb": 1000 ** 2,
+    "gb": 1000 ** 3,
+    "kib": 1024,
+    "mib": 1024 ** 2,
+    "gib": 1024 ** 3
+}
+
+def parse_size(text: str) -> Optional[int]:
+    """Parse a size string in pip output e.g. ``64 kB`` or ``1.2 MB``."""
+    match = re.match(r"\s*([\d.]+)\s*([a-zA-Z]+)\s*$", text)
+    if not match or match.group(2).lower() not in SIZE_UNITS:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+def get_name_from_file(file: str) -> Optional[str]:
+    """Get the normalized project name from a wheel or sdist filename.
+
+    :arg file: A filename, path, or URL.
+    """
+    filename = re.split(r"[/\\]", file.split("#")[0])[-1]
+    try:
+        if filename.endswith(".whl"):
+            return packaging.utils.parse_wheel_filename(filename)[0]
+        return packaging.utils.parse_sdist_filename(filename)[0]
+    except packaging.utils.InvalidWheelFilename:
+        return None
+    except packaging.utils.InvalidSdistFilename:
+        return None
+
+def parse_installed(text: str) -> Iterator[tuple]:
+    """Parse ``name-version`` pairs after ``Successfully installed``."""
+    for item in text.split():
+        name, _, version = item.rpartition("-")
+        if name:
+            yield name, version
+
+class OutputClassifier:
+    """Classify lines of ``pip install`` output into events.
+
+    Lines that don't match any pattern are ignored. The classifier keeps the
+    name of the last collected requirement, so download/build lines that
+    don't include a parsable filename can still be attributed.
+    """
+    def __init__(self):
+        self.current = None
+
+    def feed(self, line: str, time: float = 0.0) -> List[tuple]:
+        """Classify a line.
+
+        :arg line: A line of the output.
+        :arg time: The time of the line.
+        :return: A list of events.
+        """
+        line = line.strip()
+        match = re.match(r"Collecting (\S+)", line)
+        if match:
+            spec = match.group(1)
+            try:
+                name = packaging.utils.canonicalize_name(Requirement(spec).name)
+            except InvalidRequirement:
+                name = get_name_from_file(spec)
+            self.current = name
+            return [Collecting(name, spec, time)]
+        match = re.match(r"(Downloading|Using cached) (\S+)(?: \((.+?)\))?", line)
+        if match:
+            kind, file, size = match.groups()
+            name = get_name_from_file(file) or self.current
+            size = parse_size(size) if size else None
+            if kind == "Downloading":
+                return [Downloading(name, file, size, time)]
+            return [CacheHit(name, file, size, time)]
+        match = re.match(r"Processing (\S+)", line)
+        if match:
+            file = match.group(1)
+            return [Processing(get_name_from_file(file) or self.current, file, time)]
+        match = re.match(r"Building wheel for (\S+)", line)
+        if match:
+            return [BuildingWheel(packaging.utils.canonicalize_name(match.group(1)), time)]
+        match = re.match(r"Successfully installed (.+)", line)
+        if match:
+            return [Installed(name, version, time) for name, version in parse_installed(match.group(1))]
+        return []
+
+def parse_report(report: dict, time: float = 0.0) -> List[Resolved]:
+    """Create :class:`Resolved` events from a ``pip install --report`` file.
+
+    :arg report: The content of the report.
+    :arg time: The time when the report is written.
+    """
+    result = []
+    for item in report.get("install", []):
+        result.append(Resolved(
+            item["metadata"]["name"],
+            item["metadata"]["version"],
+            item.get("download_info", {}).get("url"),
+            item.get("requested", False),
+            time
+        ))
+    return result
@@ -0,0 +1,81 @@
+"""A long-lived pip worker, which is run by the venv interpreter with
+``python -c``. See :class:`vpip.execute.PipWorker`.
+
+This module must not import vpip since it is executed outside of the vpip
+package.
+
+Protocol:
+
+* The worker writes ``<token> ready`` after pip is imported.
+* Each request is a JSON line ``{"args": [...], "cwd": "...", "env": {...}}``
+  sent to stdin.
+* The worker forks a child to run pip. Output of pip is written to stdout,
+  followed by ``<token> <exit_code> <restart>``. If ``restart`` is ``1``, pip
+  is modified by the command and the worker exits.
+"""
+
+import importlib
+import json
+import os
+import sys
+import traceback
+
+PRELOAD_COMMANDS = ["install", "uninstall", "inspect", "list", "show", "freeze"]
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def run_child(request):
+    # pylint: disable=import-error
+    from pip._internal.cli.main import main as pip_main
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    try:
+        code = pip_main(request["args"])
+    except SystemExit as err:
+        code = err.code
+    except BaseException: # pylint: disable=broad-exception-caught
+        traceback.print_exc()
+        code = 1
+    if not isinstance(code, int):
+        code = 1 if code else 0
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code) # pylint: disable=protected-access
+
+def main():
+    # pylint: disable=import-error
+    import pip
+    from pip._internal.commands import commands_dict
+    token = sys.argv[1]
+    for name in PRELOAD_COMMANDS:
+        if name in commands_dict:
+            importlib.import_module(commands_dict[name].module_path)
+    pip_dir = os.path.dirname(pip.__file__)
+    pip_mtime = get_mtime(pip_dir)
+    sys.stdout.write("{} ready\n".format(token))
+    sys.stdout.flush()
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        request = json.loads(line)
+        pid = os.fork()
+        if not pid:
+            run_child(request)
+        _pid, status = os.waitpid(pid, 0)
+        code = os.waitstatus_to_exitcode(status)
+        restart = get_mtime(pip_dir) != pip_mtime
+        sys.stdout.write("{} {} {}\n".format(token, code, int(restart)))
+        sys.stdout.flush()
+        if restart:
+            break
+
+if __name__ == "__main__":
+    main()
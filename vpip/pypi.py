@@ -1,6 +1,17 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+import time
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+from packaging.utils import canonicalize_name
 from packaging.version import InvalidVersion, Version
 import requests
+from requests.adapters import HTTPAdapter
 
 UpdateResult = namedtuple("UpdateResult", ["compatible", "latest"])
 
@@ -12,15 +23,385 @@ def parse_version(s: str):
     except InvalidVersion:
         return None
 
+#: Default number of concurrent requests used by :func:`check_updates`. It can
+#: be changed with the ``concurrency`` option in ``[tool.vpip]``.
+DEFAULT_CONCURRENCY = 8
+
 def get_session():
     """Return a static :class:`requests.Session` object used by
     :func:`check_update`, so they can share a persistent connection.
+    
+    The connection pool is large enough for :func:`check_updates`.
     """
     global session
     if session is None:
         session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(DEFAULT_CONCURRENCY, get_concurrency()))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
     return session
 
+def get_config(key, default=None):
+    """Get a vpip config value. See :func:`vpip.dependency.get_vpip_config`."""
+    from .dependency import get_vpip_config
+    return get_vpip_config().get(key, default)
+
+#: Folder of the metadata cache.
+CACHE_FOLDER: str = os.path.normpath(os.path.expanduser("~/.vpip/cache/pypi"))
+
+#: Format version of cache entries. Entries with a different version are
+#: ignored.
+CACHE_VERSION: int = 2
+
+def get_cache_ttl() -> float:
+    """Get the number of seconds that a cached response is considered fresh
+    and is used without revalidation. It can be changed with the
+    ``cache_ttl`` option in ``[tool.vpip]``. Default to 0.
+    """
+    try:
+        return float(get_config("cache_ttl", 0))
+    except ValueError:
+        return 0
+
+def get_cache_file(url: str) -> str:
+    """Get the cache file path of a URL."""
+    return os.path.join(CACHE_FOLDER, hashlib.sha256(url.encode("utf8")).hexdigest() + ".json")
+
+def read_cache(url: str) -> Optional[dict]:
+    """Read the cache entry of a URL.
+    
+    :return: A dict with ``url``, ``version``, ``etag``, ``last_modified``,
+        ``time``, and ``data`` keys. None if not cached, or the entry is
+        written in another format (see :data:`CACHE_VERSION`).
+    """
+    try:
+        with open(get_cache_file(url), encoding="utf8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get("url") != url or entry.get("version") != CACHE_VERSION:
+        return None
+    return entry
+
+def write_cache(entry: dict):
+    """Write a cache entry. See :func:`read_cache`."""
+    from .pip_api import write_json
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    write_json(get_cache_file(entry["url"]), entry)
+
+def fetch(url: str, parse: Callable[[requests.Response], Any], headers: Optional[dict] = None, stream: bool = False) -> Any:
+    """Fetch a URL through the on-disk cache in :data:`CACHE_FOLDER`.
+    
+    If the cached response is fresher than :func:`get_cache_ttl`, it is used
+    directly. Otherwise, a conditional request (``If-None-Match`` /
+    ``If-Modified-Since``) is sent, and a ``304`` response is served from the
+    cache.
+    
+    :arg url: The URL.
+    :arg parse: A function converting the response to JSON-serializable
+        data, which is what actually cached.
+    :arg headers: Extra request headers.
+    :arg stream: Don't download the body before calling ``parse``.
+    :return: The parsed data.
+    
+    In offline mode (see :func:`use_index`), the cached data is returned
+    regardless of its age. If the URL is not cached, an error is raised.
+    """
+    entry = read_cache(url)
+    if is_offline():
+        if not entry:
+            raise Exception("{} is not cached. Run the command without --offline first".format(url))
+        return entry["data"]
+    now = time.time()
+    if entry and now - entry["time"] < get_cache_ttl():
+        return entry["data"]
+    headers = dict(headers or {})
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    with get_session().get(url, headers=headers, stream=stream) as r:
+        if r.status_code == 304 and entry:
+            entry["time"] = now
+            write_cache(entry)
+            return entry["data"]
+        r.raise_for_status()
+        entry = {
+            "url": url,
+            "version": CACHE_VERSION,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "time": now,
+            "data": parse(r)
+        }
+    write_cache(entry)
+    return entry["data"]
+
+#: Default package index.
+DEFAULT_INDEX_URL = "https://pypi.org/simple"
+
+#: Content type of the PEP 691 JSON simple API.
+SIMPLE_JSON_TYPE = "application/vnd.pypi.simple.v1+json"
+
+#: Default wheelhouse used by pip in offline mode.
+DEFAULT_WHEELHOUSE: str = os.path.normpath(os.path.expanduser("~/.vpip/wheelhouse"))
+
+#: Environment variable which is set to ``1`` in offline mode. It is
+#: inherited by subprocesses.
+OFFLINE_ENV = "VPIP_OFFLINE"
+
+def get_index_url() -> str:
+    """Get the base URL of the simple API. It is resolved in the following
+    order:
+    
+    1. The ``index_url`` option in ``[tool.vpip]``.
+    2. The ``PIP_INDEX_URL`` environment variable.
+    3. :data:`DEFAULT_INDEX_URL`.
+    """
+    url = get_config("index_url") or os.environ.get("PIP_INDEX_URL") or DEFAULT_INDEX_URL
+    return str(url).rstrip("/")
+
+def get_wheelhouse() -> str:
+    """Get the folder of local wheels used in offline mode. It can be changed
+    with the ``wheelhouse`` option in ``[tool.vpip]``. Default to
+    :data:`DEFAULT_WHEELHOUSE`.
+    """
+    path = get_config("wheelhouse")
+    if not path:
+        return DEFAULT_WHEELHOUSE
+    return os.path.abspath(os.path.expanduser(str(path)))
+
+def is_offline() -> bool:
+    """Check if offline mode is enabled."""
+    return os.environ.get(OFFLINE_ENV) == "1"
+
+@contextmanager
+def use_index(offline: bool = False):
+    """A context manager that makes pip follow the index config of vpip.
+    
+    Options are passed to pip with environment variables, so they work with
+    both subprocesses and pip workers:
+    
+    * If ``index_url`` is set in ``[tool.vpip]``, it is used as
+      ``PIP_INDEX_URL``.
+    * If ``offline`` is True, update checks are answered from the metadata
+      cache (see :func:`fetch`), and pip installs packages from
+      :func:`get_wheelhouse` with ``--no-index``.
+    
+    :arg offline: Enable offline mode.
+    """
+    env = {}
+    index_url = get_config("index_url")
+    if index_url:
+        env["PIP_INDEX_URL"] = str(index_url)
+    if offline:
+        env[OFFLINE_ENV] = "1"
+        env["PIP_NO_INDEX"] = "1"
+        env["PIP_FIND_LINKS"] = get_wheelhouse()
+    old_env = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for key, value in old_env.items():
+            if value is None:
+                del os.environ[key]
+            else:
+                os.environ[key] = value
+
+def get_json_api_url(pkg: str, index_url: str, version: Optional[str] = None) -> Optional[str]:
+    """Get the URL of the PyPI JSON API from the simple API URL e.g.
+    ``https://pypi.org/simple`` -> ``https://pypi.org/pypi/{pkg}/json``.
+    
+    :arg version: If defined, get the URL of the release
+        (``/pypi/{pkg}/{version}/json``).
+    :return: None if the URL doesn't end with ``/simple``.
+    """
+    if not index_url.endswith("/simple"):
+        return None
+    if version:
+        return "{}/pypi/{}/{}/json".format(index_url[:-len("/simple")], pkg, version)
+    return "{}/pypi/{}/json".format(index_url[:-len("/simple")], pkg)
+
+def get_version_index(pkg: str) -> "VersionIndex":
+    """Get the :class:`VersionIndex` of a package.
+    
+    It uses the PEP 691 JSON simple API (``/simple/{pkg}/``), which only
+    the ``versions`` key is parsed. If the index doesn't support it, fall
+    back to the PyPI JSON API (``/pypi/{pkg}/json``).
+    
+    The version index, instead of the raw response, is stored in the
+    metadata cache so it doesn't have to be rebuilt on each call.
+    
+    :arg pkg: Package name.
+    """
+    index_url = get_index_url()
+    data = fetch(
+        "{}/{}/".format(index_url, canonicalize_name(pkg)),
+        lambda r: VersionIndex.build(parse_simple_versions(r)),
+        headers={"Accept": SIMPLE_JSON_TYPE},
+        stream=True
+    )
+    if data is None:
+        url = get_json_api_url(pkg, index_url)
+        if not url:
+            raise Exception("unable to get versions of {} from {}".format(pkg, index_url))
+        data = fetch(url, lambda r: VersionIndex.build(r.json()["releases"].keys()))
+    return VersionIndex(data)
+
+def get_versions(pkg: str) -> List[str]:
+    """Get release versions of a package, excluding pre-releases and invalid
+    versions. See :func:`get_version_index`.
+    
+    :arg pkg: Package name.
+    :return: A sorted list of version strings.
+    """
+    return get_version_index(pkg).versions()
+
+def get_release_files(pkg: str, version: str) -> List[dict]:
+    """Get distribution files of a release from the PyPI JSON API.
+    
+    :arg pkg: Package name.
+    :arg version: The exact version.
+    :return: A list of dicts with ``filename``, ``url``, and ``sha256``
+        properties. Files without a SHA256 digest are excluded.
+    """
+    url = get_json_api_url(canonicalize_name(pkg), get_index_url(), version)
+    if not url:
+        raise Exception("unable to get files of {} from {}".format(pkg, get_index_url()))
+    return fetch(url, parse_release_files)
+
+def parse_release_files(r: requests.Response) -> List[dict]:
+    """Get files from a PyPI JSON API response of a release."""
+    return [
+        {"filename": f["filename"], "url": f["url"], "sha256": f["digests"]["sha256"]}
+        for f in r.json()["urls"]
+        if f.get("digests", {}).get("sha256")
+    ]
+
+def get_releases_files(packages: Iterable[tuple], concurrency: Optional[int] = None) -> Iterator[Optional[List[dict]]]:
+    """Get files of multiple releases concurrently. See
+    :func:`get_release_files`.
+    
+    :arg packages: A list of ``(pkg, version)`` tuples.
+    :arg concurrency: Max number of concurrent requests. Default to
+        :func:`get_concurrency`.
+    :return: Results in the same order as ``packages``. The result is None
+        if files of the release are not available e.g. the package is not
+        on the index.
+    """
+    packages = list(packages)
+    if not packages:
+        return
+    def get_files(item):
+        try:
+            return get_release_files(*item) or None
+        except Exception: # pylint: disable=broad-exception-caught
+            return None
+    get_session()
+    with ThreadPoolExecutor(max_workers=concurrency or get_concurrency()) as executor:
+        yield from executor.map(get_files, packages)
+
+def format_hashed_lock(lines: List[str]) -> Optional[str]:
+    """Convert ``pip freeze`` lines to a lock file with hashes, which can be
+    installed with ``pip install --no-deps --require-hashes``.
+    
+    Files of each release are fetched from the index concurrently. Their
+    URLs are written as comments and their hashes are written as ``--hash``
+    options.
+    
+    :return: None if hashes of some packages are not available e.g. the
+        package is not published.
+    """
+    packages = [tuple(line.split("==", 1)) for line in lines]
+    output = []
+    missing = []
+    for (name, version), files in zip(packages, get_releases_files(packages)):
+        if not files:
+            missing.append(name)
+            continue
+        output.extend("# {}".format(f["url"]) for f in files)
+        output.append(" \\\n".join([
+            "{}=={}".format(name, version),
+            *("    --hash=sha256:{}".format(f["sha256"]) for f in files)
+        ]))
+    if missing:
+        print("unable to get hashes of {}, write the lock file without hashes".format(", ".join(missing)))
+        return None
+    return "\n".join(output)
+
+def parse_simple_versions(r: requests.Response) -> Optional[List[str]]:
+    """Get ``versions`` from a PEP 691 response without parsing the entire
+    document. Return None if the response is not in JSON format or
+    ``versions`` is missing (API version < 1.1)."""
+    if not r.headers.get("Content-Type", "").startswith(SIMPLE_JSON_TYPE):
+        return None
+    r.encoding = "utf-8"
+    return find_json_value(r.iter_content(64 * 1024, decode_unicode=True), "versions")
+
+def find_json_value(chunks: Iterable[str], key: str) -> Any:
+    """Find the value of the first ``key`` in a JSON stream. Other parts of
+    the document are skipped without being decoded and are not kept in
+    memory.
+    
+    :arg chunks: Text chunks of the document.
+    :arg key: The key.
+    :return: The value. None if not found.
+    """
+    pattern = re.compile(r'"{}"\s*:\s*'.format(re.escape(key)))
+    chunks = iter(chunks)
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        match = pattern.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        # keep the tail in case the key is split between chunks
+        buffer = buffer[-256:]
+    else:
+        return None
+    decoder = json.JSONDecoder()
+    while True:
+        try:
+            return decoder.raw_decode(buffer.lstrip())[0]
+        except json.JSONDecodeError:
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise
+            buffer += chunk
+
+def get_concurrency() -> int:
+    """Get the number of concurrent requests."""
+    try:
+        return max(1, int(get_config("concurrency", DEFAULT_CONCURRENCY)))
+    except ValueError:
+        return DEFAULT_CONCURRENCY
+
+def check_updates(packages: Iterable[tuple], concurrency: Optional[int] = None) -> Iterator[Optional[UpdateResult]]:
+    """Check updates of multiple packages concurrently.
+    
+    :arg packages: A list of ``(pkg, curr_version)`` tuples. If
+        ``curr_version`` is None, the package is skipped and the result is
+        None.
+    :arg concurrency: Max number of concurrent requests. Default to
+        :func:`get_concurrency`.
+    :return: Results of :func:`check_update`, in the same order as
+        ``packages``. Each result is yielded as soon as it and all results
+        before it are ready.
+    """
+    packages = list(packages)
+    if not packages:
+        return
+    def check(item):
+        pkg, curr_version = item
+        if not curr_version:
+            return None
+        return check_update(pkg, curr_version)
+    get_session()
+    with ThreadPoolExecutor(max_workers=concurrency or get_concurrency()) as executor:
+        yield from executor.map(check, packages)
+
 def check_update(pkg, curr_version):
     """Check update from pypi and return the result if there is an update
     available.
@@ -38,39 +419,87 @@ def check_update(pkg, curr_version):
     If ``result.latest`` is not None, it must larger than ``result.compatible``
     and ``curr_version``.
     """
-    r = get_session().get("https://pypi.org/pypi/{}/json".format(pkg))
-    r.raise_for_status()
-    
-    # curr_version = packaging.version.parse(curr_version)
-    all_versions = [parse_version(v) for v in r.json()["releases"].keys()]
-    all_versions = [v for v in all_versions if v and not v.is_prerelease]
-    all_versions.sort()
-    
+    index = get_version_index(pkg)
     curr_version = Version(curr_version)
-    latest = None
-    compatible = None
     
-    for version in reversed(all_versions):
-        if is_compatible(curr_version, version):
-            compatible = version if version != curr_version else None
-            break
-            
-    if all_versions[-1] not in (compatible, curr_version):
-        latest = all_versions[-1]
+    compatible = index.latest_compatible(curr_version)
+    if compatible and compatible <= curr_version:
+        compatible = None
+        
+    latest = index.latest()
+    if latest and (latest <= curr_version or latest == compatible):
+        latest = None
             
     if compatible or latest:
         return UpdateResult(compatible, latest)
+    return None
+
+def get_compatible_key(version: Version) -> tuple:
+    """Get the key of the compatible range of a version. Two versions are
+    compatible if they have the same key.
+    
+    * ``x.y.z`` -> ``(epoch, x)`` if ``x`` is not zero.
+    * ``0.y.z`` -> ``(epoch, 0, y)``.
+    """
+    if version.major != 0:
+        return (version.epoch, version.major)
+    return (version.epoch, 0, version.minor)
 
 def is_compatible(version: Version, new_version: Version) -> bool:
     """Check if two versions are compatible. ``new_version`` may be smaller
     than ``version``.
     """
-    # if any(isinstance(v, LegacyVersion) for v in [version, new_version]):
-    #     return False
-    if version.major == new_version.major:
-        if version.major != 0:
-            return True
-        if version.minor == new_version.minor:
-            return True
-    return False
+    return get_compatible_key(version) == get_compatible_key(new_version)
+
+class VersionIndex:
+    """Sorted release versions of a package, grouped by ``(epoch, major,
+    minor)``. Pre-releases and invalid versions are excluded.
+    
+    The index is a JSON-serializable list of ``[epoch, major, minor,
+    [version, ...]]`` groups, so it can be stored in the metadata cache. Lookups are
+    done with :mod:`bisect` on the group keys, so version strings are only
+    parsed when they are returned.
     
+    :arg data: The data created by :meth:`build`.
+    """
+    def __init__(self, data: List[list]):
+        self.groups = data
+        self.keys = [(epoch, major, minor) for epoch, major, minor, _versions in data]
+        
+    @staticmethod
+    def build(versions: Optional[Iterable[str]]) -> Optional[List[list]]:
+        """Build index data from version strings.
+        
+        :arg versions: Version strings. If None, return None.
+        """
+        if versions is None:
+            return None
+        parsed = [parse_version(v) for v in versions]
+        parsed = sorted(v for v in parsed if v and not v.is_prerelease)
+        groups = []
+        for version in parsed:
+            if not groups or groups[-1][:3] != [version.epoch, version.major, version.minor]:
+                groups.append([version.epoch, version.major, version.minor, []])
+            groups[-1][3].append(str(version))
+        return groups
+        
+    def versions(self) -> List[str]:
+        """Get all versions in ascending order."""
+        return [v for _epoch, _major, _minor, versions in self.groups for v in versions]
+        
+    def latest(self) -> Optional[Version]:
+        """Get the latest version."""
+        if not self.groups:
+            return None
+        return Version(self.groups[-1][3][-1])
+        
+    def latest_compatible(self, version: Version) -> Optional[Version]:
+        """Get the latest version that is compatible with ``version``. See
+        :func:`is_compatible`.
+        """
+        key = get_compatible_key(version)
+        upper = (key[0], key[1] + 1) if len(key) == 2 else (key[0], 0, key[2] + 1)
+        i = bisect.bisect_left(self.keys, upper)
+        if i and get_compatible_key(Version(self.groups[i - 1][3][-1])) == key:
+            return Version(self.groups[i - 1][3][-1])
+        return None
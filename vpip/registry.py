@@ -0,0 +1,147 @@
+"""A registry of globally installed packages.
+
+The registry is a JSON file (:data:`REGISTRY_FILE`) describing each venv in
+:data:`vpip.venv.GLOBAL_FOLDER`, so commands like ``list -g`` don't have to
+inspect every venv. Each entry is keyed by the venv folder name and has the
+following properties:
+
+* ``name`` - The package name.
+* ``version`` - The installed version.
+* ``scripts`` - Console scripts linked to the global scripts folder.
+* ``home`` - The ``home`` of the base interpreter in ``pyvenv.cfg``.
+* ``freeze`` - Packages installed in the venv, in ``pip freeze`` format.
+* ``fingerprint`` - A ``site-packages -> mtime`` map. It changes when
+  packages are installed or removed, which means the entry is stale.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+from .lock import lock
+
+#: Path to the registry file ``~/.vpip/registry.json``.
+REGISTRY_FILE: str = os.path.normpath(os.path.expanduser("~/.vpip/registry.json"))
+
+def load() -> Dict[str, dict]:
+    """Read the registry. Return an empty dict if it doesn't exist."""
+    try:
+        with open(REGISTRY_FILE, encoding="utf8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or not isinstance(data.get("packages"), dict):
+        return {}
+    return data["packages"]
+
+def save(packages: Dict[str, dict]):
+    """Write the registry atomically."""
+    from .pip_api import write_json
+    os.makedirs(os.path.dirname(REGISTRY_FILE), exist_ok=True)
+    write_json(REGISTRY_FILE, {"packages": packages})
+
+def get_fingerprint(env_dir: str) -> Dict[str, int]:
+    """Get modification times of site-packages folders in a venv."""
+    from .venv import get_site_packages
+    result = {}
+    for folder in get_site_packages(env_dir):
+        try:
+            result[folder] = os.stat(folder).st_mtime_ns
+        except OSError:
+            pass
+    return result
+
+def scan(dir_name: str, scripts: Optional[List[str]] = None) -> dict:
+    """Create a registry entry by inspecting a global venv.
+
+    :arg dir_name: The folder name in :data:`vpip.venv.GLOBAL_FOLDER`, which
+        is also the package spec.
+    :arg scripts: Linked scripts. If None, keep the value in the registry.
+    """
+    from packaging.requirements import Requirement
+    from . import pip_api, venv
+    env_dir = venv.get_global_folder(dir_name)
+    name = Requirement(dir_name).name
+    if scripts is None:
+        scripts = load().get(dir_name, {}).get("scripts", [])
+    pip_api.refresh_inspect(env_dir)
+    return {
+        "name": name,
+        "version": pip_api.get_pkg_info(name, venv=env_dir).version,
+        "scripts": list(scripts),
+        "home": venv.get_venv_config(env_dir).get("home"),
+        "freeze": pip_api.freeze(venv=env_dir),
+        "fingerprint": get_fingerprint(env_dir)
+    }
+
+def update(dir_name: str, scripts: Optional[List[str]] = None):
+    """Rescan a global venv and update its entry. See :func:`scan`."""
+    with lock(REGISTRY_FILE):
+        entry = scan(dir_name, scripts)
+        packages = load()
+        packages[dir_name] = entry
+        save(packages)
+
+def remove(dir_names: Iterable[str]):
+    """Remove entries from the registry."""
+    with lock(REGISTRY_FILE):
+        packages = load()
+        for dir_name in dir_names:
+            packages.pop(dir_name, None)
+        save(packages)
+
+def get_broken_entry(dir_name: str, entry: Optional[dict]) -> dict:
+    """Create an entry for a venv that can't be inspected. The entry has no
+    version and no fingerprint, so it is rescanned next time. ``home`` is
+    read from ``pyvenv.cfg`` if possible, so :mod:`vpip.commands.update_venv`
+    can still rebuild the venv."""
+    from packaging.requirements import Requirement
+    from . import venv
+    try:
+        home = venv.get_venv_config(venv.get_global_folder(dir_name)).get("home")
+    except (OSError, ValueError):
+        home = None
+    return {
+        "name": Requirement(dir_name).name,
+        "version": None,
+        "scripts": (entry or {}).get("scripts", []),
+        "home": home,
+        "freeze": [],
+        "fingerprint": None
+    }
+
+def get_entries() -> Dict[str, dict]:
+    """Get entries of all global venvs.
+
+    Entries are validated against the global folder. Missing or stale
+    entries (see :func:`get_fingerprint`) are rescanned, and entries of
+    removed venvs are dropped. Venvs that can't be scanned get an entry from
+    :func:`get_broken_entry`. The registry is saved if anything changed.
+
+    The registry is locked during the whole process so concurrent updates
+    aren't overwritten.
+
+    :return: A ``dir_name -> entry`` map, sorted by ``dir_name``.
+    """
+    from . import venv
+    with lock(REGISTRY_FILE):
+        packages = load()
+        try:
+            dir_names = sorted(venv.iter_global_packages())
+        except OSError:
+            dir_names = []
+        result = {}
+        dirty = len(dir_names) != len(packages)
+        for dir_name in dir_names:
+            entry = packages.get(dir_name)
+            if not entry or entry.get("fingerprint") != get_fingerprint(venv.get_global_folder(dir_name)):
+                try:
+                    entry = scan(dir_name)
+                except Exception: # pylint: disable=broad-exception-caught
+                    # e.g. a broken venv
+                    entry = get_broken_entry(dir_name, entry)
+                dirty = True
+            result[dir_name] = entry
+        if dirty:
+            save(result)
+    return result
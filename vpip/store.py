@@ -0,0 +1,220 @@
+"""A content-addressed package store shared by venvs.
+
+After pip installs a package, files in its site-packages are hardlinked
+into ``~/.vpip/store/<name>/<version>/<tag>``. When the same distribution
+is installed into another venv, its files are replaced with hardlinks to
+the stored files, so each distribution is stored on disk only once.
+
+Files are matched with the hashes in ``RECORD``. Files outside of
+site-packages (e.g. console scripts, which embed the venv path) and files
+without a hash are never shared.
+
+The store only saves disk space. pip still downloads and installs each
+package, and linking adds work to every install. Stored files must not be
+edited in place since the change would be visible to all venvs and the
+store. pip never does that: upgrading or uninstalling a package removes its
+files, but a manual patch would. Therefore the store is disabled by
+default. See :func:`is_enabled`.
+"""
+
+import csv
+import json
+import os
+import shutil
+from pathlib import Path
+from time import time
+from typing import Dict, Iterable, Optional
+
+import packaging.utils
+
+#: Absolute path to the store folder ``~/.vpip/store``.
+STORE_FOLDER: str = os.path.normpath(os.path.expanduser("~/.vpip/store"))
+
+#: Files in dist-info that are different for each install.
+INSTALL_SPECIFIC_FILES = {"RECORD", "INSTALLER", "REQUESTED", "direct_url.json"}
+
+def is_enabled() -> bool:
+    """Check if the store is enabled. It can be enabled with ``store =
+    true`` in ``[tool.vpip]``."""
+    from .dependency import is_config_enabled
+    return is_config_enabled("store")
+
+def read_record(dist_info: str) -> Dict[str, str]:
+    """Read ``RECORD`` of an installed distribution.
+
+    :arg dist_info: Path to the ``.dist-info`` folder.
+    :return: A ``path -> hash`` map. Paths are relative to site-packages and
+        use ``/`` as the separator. Paths outside of site-packages, files
+        without a hash, and :data:`INSTALL_SPECIFIC_FILES` are excluded.
+    """
+    dist_info_name = os.path.basename(dist_info)
+    result = {}
+    with open(os.path.join(dist_info, "RECORD"), encoding="utf8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[1]:
+                continue
+            path = row[0].replace("\\", "/")
+            if path.startswith(("/", "../")) or ":" in path:
+                continue
+            folder, _, name = path.rpartition("/")
+            if folder == dist_info_name and name in INSTALL_SPECIFIC_FILES:
+                continue
+            result[path] = row[1]
+    return result
+
+def get_wheel_tag(dist_info: str) -> Optional[str]:
+    """Get the wheel tag from the ``WHEEL`` file e.g. ``py3-none-any``.
+    Multiple tags are joined with ``.``. Return None if the file doesn't
+    exist."""
+    try:
+        text = Path(dist_info, "WHEEL").read_text(encoding="utf8")
+    except OSError:
+        return None
+    tags = []
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip().lower() == "tag":
+            tags.append(value.strip())
+    return ".".join(sorted(tags)) or None
+
+def get_entry_folder(name: str, version: str, tag: str) -> str:
+    """Get the store folder of a distribution."""
+    return os.path.join(STORE_FOLDER, packaging.utils.canonicalize_name(name), version, tag)
+
+def link_file(src: str, dst: str):
+    """Atomically replace ``dst`` with a hardlink to ``src``."""
+    tmp = "{}.vpip-{}".format(dst, os.getpid())
+    os.link(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+def add_entry(folder: str, site_packages: str, hashes: Dict[str, str]):
+    """Create a store entry by hardlinking installed files. The entry is
+    built in a temporary folder and renamed into place."""
+    tmp_folder = "{}.tmp-{}-{}".format(folder, os.getpid(), time())
+    try:
+        for path in hashes:
+            target = os.path.join(tmp_folder, "files", path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.link(os.path.join(site_packages, path), target)
+        Path(tmp_folder, "hashes.json").write_text(json.dumps(hashes), encoding="utf8")
+        os.rename(tmp_folder, folder)
+    except OSError:
+        # the entry may be added by another process
+        if not os.path.exists(folder):
+            raise
+    finally:
+        if os.path.exists(tmp_folder):
+            shutil.rmtree(tmp_folder)
+
+def link_dist(name: str, version: str, dist_info: str) -> int:
+    """Link files of an installed distribution with the store.
+
+    If the distribution is not in the store, its files are added to the
+    store. Otherwise, files matching the stored hashes are replaced with
+    hardlinks to the stored files.
+
+    :arg name: Package name.
+    :arg version: Package version.
+    :arg dist_info: Path to the ``.dist-info`` folder.
+    :return: Number of bytes deduplicated. Empty files are not linked.
+    """
+    tag = get_wheel_tag(dist_info)
+    if not tag:
+        return 0
+    site_packages = os.path.dirname(dist_info)
+    hashes = read_record(dist_info)
+    hashes = {p: h for p, h in hashes.items() if os.path.isfile(os.path.join(site_packages, p))}
+    folder = get_entry_folder(name, version, tag)
+    if not os.path.exists(folder):
+        os.makedirs(os.path.dirname(folder), exist_ok=True)
+        add_entry(folder, site_packages, hashes)
+        return 0
+    try:
+        stored_hashes = json.loads(Path(folder, "hashes.json").read_text(encoding="utf8"))
+    except (OSError, ValueError):
+        return 0
+    saved = 0
+    for path, file_hash in hashes.items():
+        if stored_hashes.get(path) != file_hash:
+            continue
+        src = os.path.join(folder, "files", path)
+        dst = os.path.join(site_packages, path)
+        try:
+            if os.path.samefile(src, dst):
+                continue
+            size = os.path.getsize(dst)
+            if not size:
+                continue
+            link_file(src, dst)
+        except OSError:
+            continue
+        saved += size
+    return saved
+
+def link_packages(names: Optional[Iterable[str]] = None) -> int:
+    """Link installed packages in the active venv with the store. Errors are
+    ignored since the store is only an optimization.
+
+    Linking changes modification times in site-packages, so the inspect
+    cache is refreshed afterwards (see :func:`vpip.pip_api.refresh_inspect`).
+
+    :arg names: Package names e.g. packages collected by
+        :func:`vpip.pip_api.install`. If None, link all packages.
+    :return: Number of bytes deduplicated.
+    """
+    from .pip_api import inspect, refresh_inspect
+    if not is_enabled():
+        return 0
+    graph = inspect()
+    if names is None:
+        packages = list(graph.packages.values())
+    else:
+        names = (packaging.utils.canonicalize_name(n) for n in names)
+        packages = [graph.packages[n] for n in names if n in graph.packages]
+    saved = 0
+    for pkg in packages:
+        if not pkg.metadata_location or not pkg.metadata_location.endswith(".dist-info") or pkg.editable:
+            continue
+        try:
+            saved += link_dist(pkg.name, pkg.version, pkg.metadata_location)
+        except OSError:
+            pass
+    if saved:
+        refresh_inspect()
+    return saved
+
+def iter_entries() -> Iterable[str]:
+    """Iterate through entry folders in the store."""
+    for name in Path(STORE_FOLDER).glob("*/*/*"):
+        if name.is_dir() and ".tmp-" not in name.name:
+            yield str(name)
+
+def is_referenced(folder: str) -> bool:
+    """Check if any file in the entry is linked by a venv."""
+    for root, _dirs, files in os.walk(os.path.join(folder, "files")):
+        for file in files:
+            if os.stat(os.path.join(root, file)).st_nlink > 1:
+                return True
+    return False
+
+def prune() -> list:
+    """Remove entries that are not referenced by any venv.
+
+    :return: A list of removed entry folders.
+    """
+    removed = []
+    for folder in iter_entries():
+        if is_referenced(folder):
+            continue
+        shutil.rmtree(folder)
+        removed.append(folder)
+        for parent in [os.path.dirname(folder), os.path.dirname(os.path.dirname(folder))]:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+    return removed
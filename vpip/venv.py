@@ -1,16 +1,20 @@
 from __future__ import annotations
 
+import configparser
+import glob
+import hashlib
 import os
 import re
 import shutil
 import sysconfig
 import sys
 import venv
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, List, Optional
 
-from .execute import execute
+from .execute import execute, stop_pip_workers
+from .lock import lock
 
 def get_script_folder(base):
     if os.name == "nt":
@@ -20,6 +24,14 @@ def get_script_folder(base):
 #: Absolute path to the global package venv folder ``~/.vpip/pkg_venvs``
 GLOBAL_FOLDER: str = os.path.normpath(os.path.expanduser("~/.vpip/pkg_venvs"))
 
+#: Absolute path to the template venv folder ``~/.vpip/templates``. See
+#: :func:`get_template_folder`.
+TEMPLATE_FOLDER: str = os.path.normpath(os.path.expanduser("~/.vpip/templates"))
+
+#: A file in the template venv, which contains the path where the template
+#: is built.
+TEMPLATE_ORIGIN_FILE = ".vpip-template"
+
 #: These packages are pre-installed by vpip. They are excluded from the lock file. You can update them via ``update_venv`` command.
 PREINSTALLED_PACKAGES: List[str] = ["pip", "wheel"]
 
@@ -69,6 +81,36 @@ def iter_global_packages():
     for dir in Path(GLOBAL_FOLDER).iterdir():
         yield dir.name
     
+def get_venv_config(env_dir) -> dict[str, str]:
+    """Read ``pyvenv.cfg`` of a venv.
+    
+    :arg str env_dir: The venv folder.
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    text = Path(env_dir, "pyvenv.cfg").read_text(encoding="utf8")
+    config.read_string("[DEFAULT]\n" + text)
+    return dict(config["DEFAULT"])
+
+def get_site_packages(env_dir) -> List[str]:
+    """Get site-packages folders of a venv.
+    
+    :arg str env_dir: The venv folder.
+    :return: A list of folders. Return an empty list if the venv includes
+        system site-packages, since they can't be determined without running
+        the interpreter.
+    """
+    try:
+        config = get_venv_config(env_dir)
+    except OSError:
+        return []
+    if config.get("include-system-site-packages", "false").lower() == "true":
+        return []
+    if os.name == "nt":
+        folders = [os.path.join(env_dir, "Lib", "site-packages")]
+    else:
+        folders = sorted(glob.glob(os.path.join(env_dir, "lib", "python*", "site-packages")))
+    return [f for f in folders if os.path.isdir(f)]
+    
 def get_path_without_venv(path, venv_dir):
     if not venv_dir:
         return path
@@ -97,6 +139,139 @@ def get_global_tmp_venv() -> Venv:
     from time import time
     return Venv(get_global_folder(f"tmp-{time()}"))
     
+def get_base_executable() -> str:
+    """Get the Python executable used to create venvs. If a venv is active,
+    find ``python`` in ``PATH`` outside of the venv.
+    """
+    current_venv = os.environ.get("VIRTUAL_ENV")
+    if current_venv:
+        clean_path = get_path_without_venv(os.environ["PATH"], current_venv)
+        # find executable that is not in the current virtual env
+        # https://github.com/python/cpython/blob/cd449806fac1246cb7b4d392026fe6986ec01fb7/Lib/venv/__init__.py#L113-L116
+        return shutil.which("python", path=clean_path)
+    return getattr(sys, "_base_executable", sys.executable)
+
+def get_python_id(executable: Optional[str] = None) -> str:
+    """Get an identity of a Python executable. It changes when the
+    interpreter is moved or replaced.
+    
+    :arg executable: The executable. Default to :func:`get_base_executable`.
+    """
+    executable = os.path.realpath(executable or get_base_executable())
+    stat = os.stat(executable)
+    key = "{}\n{}\n{}".format(executable, stat.st_size, stat.st_mtime_ns)
+    name = re.sub(r"[^\w.-]", "_", os.path.basename(executable))
+    return "{}-{}".format(name, hashlib.sha256(key.encode("utf8")).hexdigest()[:16])
+
+def get_template_folder() -> str:
+    """Get the template venv folder of the current base interpreter i.e.
+    ``~/.vpip/templates/<python-id>``.
+    
+    The template has :data:`PREINSTALLED_PACKAGES` installed. New venvs are
+    cloned from it so they don't have to bootstrap pip from the network.
+    """
+    return os.path.join(TEMPLATE_FOLDER, get_python_id())
+
+def update_template(force=False):
+    """Build the template venv if it doesn't exist. See
+    :func:`get_template_folder`. The template folder changes with
+    :func:`get_python_id`, so a new template is built when the interpreter
+    is replaced.
+    
+    The template is locked exclusively while it is built. Templates are
+    not used on Windows, so this function does nothing.
+    
+    :arg bool force: Rebuild the template even if it exists.
+    """
+    if os.name == "nt":
+        return
+    folder = get_template_folder()
+    with lock(folder):
+        if force or not os.path.exists(folder):
+            build_template(folder)
+        
+def build_template(folder):
+    """Build a template venv at ``folder``. The template is built in a
+    temporary folder, then moved into place, so other processes never see a
+    partial template."""
+    from time import time
+    tmp_folder = "{}.tmp-{}-{}".format(folder, os.getpid(), time())
+    print("building venv template at {}".format(folder))
+    try:
+        Builder(with_pip=True).create(tmp_folder)
+        Path(tmp_folder, TEMPLATE_ORIGIN_FILE).write_text(tmp_folder, encoding="utf8")
+        old_folder = None
+        if os.path.exists(folder):
+            old_folder = "{}.old-{}-{}".format(folder, os.getpid(), time())
+            os.rename(folder, old_folder)
+        try:
+            os.rename(tmp_folder, folder)
+        except OSError:
+            # built by another process
+            if not os.path.exists(folder):
+                raise
+    finally:
+        if os.path.exists(tmp_folder):
+            shutil.rmtree(tmp_folder)
+    if old_folder:
+        shutil.rmtree(old_folder, ignore_errors=True)
+
+def link_or_copy(src, dst):
+    """Create a hardlink. Copy the file if hardlinks are not supported."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+def copy_template_file(src, dst):
+    """Copy a file of the template venv. Compiled files in ``__pycache__``
+    are hardlinked since Python replaces them instead of writing in place.
+    Other files are copied, so editing a package in one venv doesn't affect
+    the template and other venvs."""
+    if os.path.basename(os.path.dirname(src)) == "__pycache__":
+        return link_or_copy(src, dst)
+    return shutil.copy2(src, dst)
+
+def clone_venv(template_dir, env_dir):
+    """Clone a template venv.
+    
+    Files are copied with :func:`copy_template_file`. Paths of the template in the scripts
+    folder (shebangs and activate scripts) and ``pyvenv.cfg`` are replaced
+    with ``env_dir``. Replaced files are written as new files so the
+    template is not modified.
+    
+    :arg str template_dir: The template folder, which must contain
+        :data:`TEMPLATE_ORIGIN_FILE`.
+    :arg str env_dir: The target folder. It must not exist.
+    """
+    origin = Path(template_dir, TEMPLATE_ORIGIN_FILE).read_text(encoding="utf8")
+    shutil.copytree(
+        template_dir, env_dir, symlinks=True, copy_function=copy_template_file,
+        ignore=lambda folder, names: [TEMPLATE_ORIGIN_FILE] if folder == template_dir else [])
+    replacements = [
+        (origin.encode("utf8"), env_dir.encode("utf8")),
+        # prompt of activate scripts
+        ("({}) ".format(os.path.basename(origin)).encode("utf8"),
+            "({}) ".format(os.path.basename(env_dir)).encode("utf8"))
+    ]
+    files = [os.path.join(env_dir, "pyvenv.cfg")]
+    script_folder = get_script_folder(env_dir)
+    files.extend(os.path.join(script_folder, name) for name in os.listdir(script_folder))
+    for file in files:
+        if os.path.islink(file) or not os.path.isfile(file):
+            continue
+        content = Path(file).read_bytes()
+        new_content = content
+        for old, new in replacements:
+            new_content = new_content.replace(old, new)
+        if new_content == content:
+            continue
+        tmp_file = file + ".tmp"
+        Path(tmp_file).write_bytes(new_content)
+        shutil.copymode(file, tmp_file)
+        os.replace(tmp_file, file)
+
 class Builder(venv.EnvBuilder):
     """An environment builder that could be used inside a venv.
     
@@ -104,12 +279,8 @@ class Builder(venv.EnvBuilder):
     """
     def ensure_directories(self, env_dir):
         context = super().ensure_directories(env_dir)
-        current_venv = os.environ.get("VIRTUAL_ENV")
-        if current_venv:
-            clean_path = get_path_without_venv(os.environ["PATH"], current_venv)
-            # find executable that is not in the current virtual env
-            # https://github.com/python/cpython/blob/cd449806fac1246cb7b4d392026fe6986ec01fb7/Lib/venv/__init__.py#L113-L116
-            executable = shutil.which("python", path=clean_path)
+        if os.environ.get("VIRTUAL_ENV"):
+            executable = get_base_executable()
             dirname, exename = os.path.split(executable)
             context.executable = executable
             context.python_dir = dirname
@@ -154,26 +325,56 @@ class Venv:
         return os.path.exists(self.env_dir)
     
     @contextmanager
-    def activate(self, auto_create=False):
+    def activate(self, auto_create=False, lock="exclusive"):
         """Activate the venv. Update PATH and VIRTUAL_ENV environment variables.
         
         :arg bool auto_create: If True then automatically create the venv when
             the folder doesn't exist.
+        :arg str lock: Lock the venv while it is activated (see
+            :mod:`vpip.lock`). Use ``"exclusive"`` when the venv is modified,
+            ``"shared"`` when it is only read, or None to skip locking.
+            ``auto_create`` requires an exclusive lock.
             
         This function can be used as a context manager that will
         :meth:`deactivate` when exited.
         """
         try:
-            if not self.exists():
-                if auto_create:
-                    self.create()
-                else:
-                    raise Exception("venv folder doesn't exists")
-            os.environ["PATH"] = self.path
-            os.environ["VIRTUAL_ENV"] = self.env_dir
-            yield
+            with self.lock(lock):
+                if not self.exists():
+                    if auto_create:
+                        self.create()
+                    else:
+                        raise Exception("venv folder doesn't exists")
+                os.environ["PATH"] = self.path
+                os.environ["VIRTUAL_ENV"] = self.env_dir
+                yield
         finally:
             self.deactivate()
+            
+    def lock(self, mode="exclusive"):
+        """Lock the venv folder. See :func:`vpip.lock.lock`.
+        
+        :arg str mode: ``"exclusive"``, ``"shared"``, or None.
+        """
+        if mode is None:
+            return nullcontext()
+        return lock(self.env_dir, exclusive=mode == "exclusive")
+        
+    def env(self) -> dict[str, str]:
+        """Get environment variables with the venv activated, without
+        modifying :data:`os.environ`. The result can be passed to
+        :func:`vpip.execute.execute` so multiple venvs can be used at the
+        same time, e.g. from threads.
+        """
+        env = dict(os.environ)
+        env["PATH"] = "{}{}{}".format(
+            get_script_folder(self.env_dir),
+            os.pathsep,
+            get_path_without_venv(env["PATH"], env.get("VIRTUAL_ENV"))
+        )
+        env["VIRTUAL_ENV"] = self.env_dir
+        env.pop("PYTHONHOME", None)
+        return env
         
     def deactivate(self):
         """Deactivate the venv."""
@@ -184,10 +385,25 @@ class Venv:
             del os.environ["VIRTUAL_ENV"]
     
     def create(self):
-        """Create the venv."""
-        print("building venv at {}".format(self.env_dir))
-        Builder(with_pip=True).create(self.env_dir)
+        """Create the venv.
+        
+        The venv is cloned from the template venv (see
+        :func:`get_template_folder`), which is built if missing. On Windows,
+        the venv is built directly since executables in ``Scripts`` can't
+        be patched.
+        """
+        with self.lock():
+            print("building venv at {}".format(self.env_dir))
+            if os.name == "nt":
+                Builder(with_pip=True).create(self.env_dir)
+                return
+            update_template()
+            template_dir = get_template_folder()
+            with lock(template_dir, exclusive=False):
+                clone_venv(template_dir, self.env_dir)
         
     def destroy(self):
         """Destroy the venv. Remove the venv folder."""
-        shutil.rmtree(self.env_dir)
+        with self.lock():
+            stop_pip_workers(self.env_dir)
+            shutil.rmtree(self.env_dir)